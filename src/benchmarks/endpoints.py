@@ -0,0 +1,721 @@
+# in built imports for arguments, JSON results, subprocesses, clocks,
+# temporary files and threads
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from string import Formatter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+# external imports for percentiles, HTTP requests and the WSGI server
+import numpy as np
+import requests
+from dotenv import load_dotenv
+from sqlalchemy import event
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+# dataset sizes generated with flask db seed-synthetic
+DATASETS = {
+    "small": {
+        "users": 1000, "media": 2000,
+        "interactions": 20000, "comments": 5000
+    },
+    "medium": {
+        "users": 20000, "media": 20000,
+        "interactions": 500000, "comments": 100000
+    },
+    "large": {
+        "users": 200000, "media": 100000,
+        "interactions": 5000000, "comments": 1000000
+    }
+}
+# password and random seed shared by every generated dataset
+PASSWORD = "password"
+RANDOM_SEED = 1
+# users logged in during setup whose tokens send the requests
+TOKEN_USERS = 20
+# records sampled from the dataset to build request parameters
+SAMPLE_SIZE = 200
+# response header carrying the number of SQL statements a request ran
+QUERY_HEADER = "X-Benchmark-Queries"
+# queries per request a scenario may gain on top of the tolerance before
+# it is a regression, cache misses make the mean vary between runs
+QUERY_SLACK = 0.5
+# items sent in each bulk interaction and batch summary request
+BATCH_ITEMS = 50
+
+
+# WSGI middleware counting the SQL statements run while handling each
+# request, statements from background threads are not counted
+class QueryCounter:
+    def __init__(self, app, engine):
+        self.app = app
+        self.local = threading.local()
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        if getattr(self.local, "active", False):
+            self.local.count += 1
+
+    def __call__(self, environ, start_response):
+        self.local.count = 0
+        self.local.active = True
+
+        # add the count once the view has run and the response starts
+        def counted_start_response(status, headers, exc_info=None):
+            headers = list(headers)
+            headers.append((QUERY_HEADER, str(self.local.count)))
+            return start_response(status, headers, exc_info)
+
+        try:
+            return self.app(environ, counted_start_response)
+        finally:
+            self.local.active = False
+
+
+# sends requests through the Flask test client, one per thread
+class TestClient:
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = client.open(path, method=method, json=body,
+                               headers=headers)
+        return (
+            response.status_code,
+            response.headers.get(QUERY_HEADER),
+            response.get_json(silent=True)
+        )
+
+
+# sends requests over HTTP with one keep-alive session per thread
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.local = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = session.request(method, self.base_url + path, json=body,
+                                   headers=headers)
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        return (
+            response.status_code, response.headers.get(QUERY_HEADER), data
+        )
+
+
+# start a threaded werkzeug server for the app on a free port
+def serve(app):
+    WSGIRequestHandler.protocol_version = "HTTP/1.1"
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# one benchmarked request type, build returns the method, path, body
+# and token of request i, collect keeps the response body of request i
+# for the later scenarios that update or delete what it created
+class Scenario:
+    def __init__(self, name, build, expected=(200,), collect=None):
+        self.name = name
+        self.build = build
+        self.expected = expected
+        self.collect = collect
+
+
+# GET request for a path and query parameters, "{key}" in the path and
+# "@key" parameter values are picked at random from that context sample
+def _get(path, auth=False, **params):
+    keys = [key for _, key, _, _ in Formatter().parse(path) if key]
+
+    def build(ctx, rng, i):
+        url = path.format(**{key: rng.choice(ctx[key]) for key in keys})
+        query = {
+            name: rng.choice(ctx[value[1:]]) if value.startswith("@")
+            else value
+            for name, value in params.items()
+        }
+        if query:
+            url += f"?{urlencode(query)}"
+        token = rng.choice(ctx["tokens"])[1] if auth else None
+        return "GET", url, None, token
+    return build
+
+
+def _collect(key):
+    return lambda ctx, body, i: ctx[key].__setitem__(i, body)
+
+
+# distinct records for a batch request
+def _sample(items, rng):
+    return rng.sample(items, min(BATCH_ITEMS, len(items)))
+
+
+# token of the user sending write request i, so later requests on the
+# same rows are sent by the user who created them
+def _writer(ctx, i):
+    return ctx["tokens"][i % len(ctx["tokens"])][1]
+
+
+# every route in the order they run, reads first so the writes and
+# deletes later in the list do not change what they measure
+def scenarios():
+    media_list = [
+        Scenario(f"media_{info}", _get("/media/", info=info))
+        for info in ("title", "plot", "rating", "all")
+    ]
+    return media_list + [
+        Scenario("media_movies", _get("/media/", info="title",
+                                      media="movie")),
+        Scenario("media_genre", _get("/media/", info="title",
+                                     genre="@genres"),
+                 expected=(200, 404)),
+        Scenario("media_actor", _get("/media/", info="title",
+                                     actor="@actors"),
+                 expected=(200, 404)),
+        Scenario("media_director", _get("/media/", info="title",
+                                        director="@directors"),
+                 expected=(200, 404)),
+        Scenario("media_comment_counts", _get("/media/", info="title",
+                                              comments="yes")),
+        Scenario("media_movie_title", _get("/media/movie", auth=True,
+                                           title="@movies")),
+        Scenario("media_tv_title", _get("/media/tv", auth=True,
+                                        title="@series")),
+        Scenario("media_cache", _get("/media/cache", auth=True)),
+        Scenario("media_trending", _get("/media/trending",
+                                        window="@windows", by="@events")),
+        Scenario("media_similar", _get("/media/{popular}/similar")),
+        Scenario("user_list", _get("/user/")),
+        Scenario("user_location", _get("/user/location",
+                                       location="@locations")),
+        Scenario("interaction_user", _get("/interaction/user", auth=True,
+                                          username="@usernames"),
+                 expected=(200, 404)),
+        Scenario("interaction_media", _get("/interaction/media", auth=True,
+                                           title="@popular_titles"),
+                 expected=(200, 404)),
+        Scenario("interaction_summary", _get("/interaction/summary",
+                                             title="@popular_titles"),
+                 expected=(200, 404)),
+        Scenario("interaction_summary_batch", lambda ctx, rng, i: (
+            "POST", "/interaction/summary/batch",
+            {"media_ids": _sample(ctx["popular"], rng)}, None
+        )),
+        Scenario("interaction_recommendations", _get(
+            "/interaction/recommendations", auth=True, limit="20"
+        )),
+        Scenario("interaction_recommendations_location", _get(
+            "/interaction/recommendations", auth=True,
+            location="@locations"
+        )),
+        Scenario("comment_tree", _get("/comment/", media_id="@commented"),
+                 expected=(200, 404)),
+        Scenario("comment_tree_title", _get(
+            "/comment/", title="@commented_titles"
+        ), expected=(200, 404)),
+        Scenario("comment_replies", _get("/comment/{threads}/replies")),
+        Scenario("user_login", lambda ctx, rng, i: (
+            "POST", "/user/login",
+            {
+                "username/email": rng.choice(ctx["tokens"])[0],
+                "password": PASSWORD
+            },
+            None
+        )),
+        Scenario("user_register", lambda ctx, rng, i: (
+            "POST", "/user/register",
+            {
+                "username": f"bench{uuid.uuid4().hex[:14]}",
+                "email": f"bench{uuid.uuid4().hex}@example.com",
+                "password": PASSWORD
+            },
+            None
+        ), expected=(201,), collect=_collect("registered")),
+        Scenario("user_update", lambda ctx, rng, i: (
+            "PATCH", "/user/update",
+            {"location": rng.choice(ctx["locations"])},
+            rng.choice(ctx["tokens"])[1]
+        )),
+        Scenario("interaction_create", lambda ctx, rng, i: (
+            "POST", f"/interaction/{ctx['fresh_media'][i]}",
+            {"watched": "yes", "rating": rng.randint(0, 10),
+             "watchlist": "no"},
+            _writer(ctx, i)
+        ), expected=(201,), collect=_collect("interactions")),
+        Scenario("interaction_update", lambda ctx, rng, i: (
+            "PATCH", f"/interaction/{ctx['fresh_media'][i]}",
+            {"rating": rng.randint(0, 10)},
+            _writer(ctx, i)
+        )),
+        Scenario("interaction_bulk", lambda ctx, rng, i: (
+            "POST", "/interaction/bulk",
+            [
+                {"media_id": media_id, "watched": "yes",
+                 "rating": rng.randint(0, 10)}
+                for media_id in _sample(ctx["popular"], rng)
+            ],
+            rng.choice(ctx["tokens"])[1]
+        )),
+        Scenario("comment_create", lambda ctx, rng, i: (
+            "POST", "/comment/create",
+            {
+                "title": ctx["commented_titles"][
+                    i % len(ctx["commented_titles"])
+                ],
+                "category": ctx["commented_categories"][
+                    i % len(ctx["commented_titles"])
+                ],
+                "content": f"Benchmark comment {i}"
+            },
+            _writer(ctx, i)
+        ), expected=(201,), collect=_collect("comments")),
+        Scenario("comment_update", lambda ctx, rng, i: (
+            "PATCH", f"/comment/{ctx['comments'][i]['id']}",
+            {"content": f"Edited benchmark comment {i}"},
+            _writer(ctx, i)
+        )),
+        Scenario("comment_delete", lambda ctx, rng, i: (
+            "DELETE", f"/comment/{ctx['comments'][i]['id']}", None,
+            _writer(ctx, i)
+        )),
+        Scenario("interaction_delete", lambda ctx, rng, i: (
+            "DELETE", f"/interaction/{ctx['interactions'][i]['id']}",
+            None, _writer(ctx, i)
+        )),
+        Scenario("media_delete", lambda ctx, rng, i: (
+            "DELETE", f"/media/{ctx['fresh_media'][i]}", None,
+            ctx["admin_token"]
+        )),
+        Scenario("user_delete", lambda ctx, rng, i: (
+            "DELETE", f"/user/{ctx['registered'][i]['id']}", None,
+            ctx["admin_token"]
+        ))
+    ]
+
+
+# drop and recreate the tables, then load a synthetic dataset
+def seed_dataset(app, sizes):
+    from init import db
+    from services import synthetic_data, media_stats, media_activity
+    from services import comment_store, similarity
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        synthetic_data.seed(
+            sizes["users"], sizes["media"], sizes["interactions"],
+            sizes["comments"], password=PASSWORD, random_seed=RANDOM_SEED
+        )
+        media_stats.rebuild()
+        media_activity.rebuild()
+        comment_store.rebuild_counts()
+        similarity.build(full=True)
+
+
+# rows in each table the scenarios read
+def table_sizes(app):
+    from init import db
+    from models.user import User
+    from models.media import Media
+    from models.interaction import Interaction
+    from models.comment import Comment
+    with app.app_context():
+        return {
+            name: db.session.scalar(
+                db.select(db.func.count()).select_from(model)
+            )
+            for name, model in (
+                ("users", User), ("media", Media),
+                ("interactions", Interaction), ("comments", Comment)
+            )
+        }
+
+
+# sample request parameters from the dataset, log users in and create
+# the rows the write and delete scenarios work on
+def prepare(app, client, fresh_count):
+    from init import db
+    from models.user import User
+    from models.media import Media
+    from models.media_stats import MediaStats
+    from models.comment import Comment
+    from models.genre import Genre
+    from models.person import Person, MediaPerson
+    from services import media_activity, passwords
+    random_order = db.func.random()
+    with app.app_context():
+        popular = db.session.execute(
+            db.select(Media.id, Media.title, Media.category)
+            .join(MediaStats, MediaStats.media_id == Media.id)
+            .order_by(MediaStats.interaction_count.desc())
+            .limit(SAMPLE_SIZE)
+        ).all()
+        commented = db.session.execute(
+            db.select(Media.id, Media.title, Media.category)
+            .filter(Media.comment_count > 0)
+            .order_by(Media.comment_count.desc())
+            .limit(SAMPLE_SIZE)
+        ).all()
+        ctx = {
+            "popular": [row.id for row in popular],
+            "popular_titles": [row.title for row in popular],
+            "movies": [row.title for row in popular
+                       if row.category.value == "movie"],
+            "series": [row.title for row in popular
+                       if row.category.value == "series"],
+            "commented": [row.id for row in commented],
+            "commented_titles": [row.title for row in commented],
+            "commented_categories": [
+                row.category.value for row in commented
+            ],
+            "threads": db.session.scalars(
+                db.select(Comment.id).filter(Comment.reply_count > 0)
+                .order_by(random_order).limit(SAMPLE_SIZE)
+            ).all(),
+            "genres": db.session.scalars(db.select(Genre.name)).all(),
+            "locations": db.session.scalars(
+                db.select(User.location).filter(User.location.isnot(None))
+                .distinct()
+            ).all(),
+            "windows": list(media_activity.WINDOWS),
+            "events": list(media_activity.EVENTS),
+            "usernames": db.session.scalars(
+                db.select(User.username).order_by(random_order)
+                .limit(SAMPLE_SIZE)
+            ).all()
+        }
+        for role in ("actor", "director"):
+            ctx[f"{role}s"] = db.session.scalars(
+                db.select(Person.name).join(MediaPerson)
+                .filter(MediaPerson.role == role)
+                .order_by(random_order).limit(SAMPLE_SIZE)
+            ).all()
+        # synthetic users whose tokens send the authenticated requests
+        login_users = db.session.scalars(
+            db.select(User.username).filter(
+                User.username.like("synth_user_%")
+            ).order_by(random_order).limit(TOKEN_USERS)
+        ).all()
+        # admin for the admin only delete routes
+        admin_name = "benchmark_admin"
+        if not db.session.scalar(
+                db.select(User.id).filter_by(username=admin_name)):
+            db.session.add(User(
+                username=admin_name,
+                email="benchmark_admin@example.com",
+                password=passwords.hash_password(PASSWORD),
+                is_admin=True
+            ))
+        # media without interactions or comments for the interaction
+        # writes and the media deletes
+        fresh = [
+            Media(title=f"Benchmark Media {uuid.uuid4().hex}",
+                  category="movie")
+            for _ in range(fresh_count)
+        ]
+        db.session.add_all(fresh)
+        db.session.commit()
+        ctx["fresh_media"] = [media.id for media in fresh]
+    ctx["tokens"] = []
+    for username in login_users:
+        status, _, body = client.request(
+            "POST", "/user/login",
+            {"username/email": username, "password": PASSWORD}
+        )
+        if status == 200:
+            ctx["tokens"].append((username, body["token"]))
+    _, _, body = client.request(
+        "POST", "/user/login",
+        {"username/email": admin_name, "password": PASSWORD}
+    )
+    ctx["admin_token"] = body["token"]
+    for key in ("registered", "interactions", "comments"):
+        ctx[key] = {}
+    return ctx
+
+
+# latency and query statistics for one scenario
+def summarise(latencies, statuses, queries, errors, elapsed):
+    latencies = np.array(latencies) * 1000
+    counted = [count for count in queries if count is not None]
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {
+            str(status): statuses.count(status)
+            for status in sorted(set(statuses))
+        },
+        "throughput": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(latencies.max()), 3),
+        "queries_per_request": (
+            round(float(np.mean(counted)), 2) if counted else None
+        ),
+        "max_queries": max(counted) if counted else None
+    }
+
+
+# run the warmup requests one at a time, then time the rest across
+# the worker threads
+def run_scenario(client, scenario, ctx, count, warmup, concurrency):
+    calls = [
+        scenario.build(ctx, random.Random(f"{scenario.name}:{i}"), i)
+        for i in range(warmup + count)
+    ]
+
+    def send(i):
+        started = time.perf_counter()
+        status, queries, body = client.request(*calls[i])
+        latency = time.perf_counter() - started
+        if scenario.collect and status in scenario.expected:
+            scenario.collect(ctx, body, i)
+        return latency, status, int(queries) if queries else None
+
+    for i in range(warmup):
+        send(i)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, range(warmup, len(calls))))
+    elapsed = time.perf_counter() - started
+    latencies, statuses, queries = zip(*results)
+    errors = sum(status not in scenario.expected for status in statuses)
+    return summarise(latencies, list(statuses), queries, errors, elapsed)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# benchmark one dataset in this process
+def run_dataset(args, name):
+    from main import create_app
+    from init import db
+    app = create_app()
+    if name in DATASETS and not args.no_seed:
+        print(f"Seeding {name} dataset", file=sys.stderr)
+        seed_dataset(app, DATASETS[name])
+    with app.app_context():
+        app.wsgi_app = QueryCounter(app.wsgi_app, db.engine)
+    server = None
+    if args.server == "wsgi":
+        server = serve(app)
+        client = HttpClient(f"http://127.0.0.1:{server.server_port}")
+    else:
+        client = TestClient(app)
+    selected = [
+        scenario for scenario in scenarios()
+        if not args.only or any(
+            pattern in scenario.name for pattern in args.only
+        )
+    ]
+    ctx = prepare(app, client, args.warmup + args.requests)
+    results = {}
+    try:
+        for scenario in selected:
+            try:
+                results[scenario.name] = run_scenario(
+                    client, scenario, ctx, args.requests, args.warmup,
+                    args.concurrency
+                )
+            # scenarios reading rows an unselected scenario creates
+            except (IndexError, KeyError) as err:
+                print(f"{scenario.name} skipped: needs {err!r}",
+                      file=sys.stderr)
+                continue
+            print_result(name, scenario.name, results[scenario.name])
+    finally:
+        if server:
+            server.shutdown()
+    return {"sizes": table_sizes(app), "scenarios": results}
+
+
+def print_result(dataset, scenario, result):
+    queries = result["queries_per_request"]
+    print(
+        f"{dataset:<8} {scenario:<38} {result['throughput']:>9.1f}/s"
+        f"  p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms"
+        f"  p99 {result['p99_ms']:>8.2f}ms"
+        f"  queries {queries if queries is not None else '-':>5}"
+        f"  errors {result['errors']}"
+    )
+
+
+# differences from a baseline beyond the tolerance, a regression is a
+# slower p95, lower throughput, more queries per request or more errors
+def compare(baseline, current, tolerance):
+    regressions = []
+    for dataset, data in current["datasets"].items():
+        before = baseline["datasets"].get(dataset, {}).get("scenarios", {})
+        for scenario, result in data["scenarios"].items():
+            if scenario not in before:
+                continue
+            old = before[scenario]
+            checks = [
+                ("p95_ms", result["p95_ms"] > old["p95_ms"] * (1 + tolerance)),
+                ("throughput",
+                 result["throughput"] < old["throughput"] * (1 - tolerance)),
+                ("queries_per_request",
+                 (result["queries_per_request"] or 0)
+                 > (old["queries_per_request"] or 0) * (1 + tolerance)
+                 + QUERY_SLACK),
+                ("errors", result["errors"] > old["errors"])
+            ]
+            regressions.extend(
+                f"{dataset:<8} {scenario:<38} {metric:<20}"
+                f" {old[metric]} -> {result[metric]}"
+                for metric, regressed in checks if regressed
+            )
+    return regressions
+
+
+def report_comparison(baseline_path, current, tolerance):
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    regressions = compare(baseline, current, tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print(f"No regressions against {baseline_path}")
+    return 1 if regressions else 0
+
+
+# run each dataset in its own process so caches and the recommender
+# model of one dataset are not reused for the next
+def run(args):
+    names = args.datasets.split(",")
+    if len(names) == 1:
+        datasets = {names[0]: run_dataset(args, names[0])}
+    else:
+        datasets = {}
+        for name in names:
+            with tempfile.TemporaryDirectory() as directory:
+                output = os.path.join(directory, "result.json")
+                command = [
+                    sys.executable, "-m", "benchmarks.endpoints", "run",
+                    "--datasets", name, "--requests", str(args.requests),
+                    "--warmup", str(args.warmup),
+                    "--concurrency", str(args.concurrency),
+                    "--server", args.server, "--output", output
+                ]
+                if args.no_seed:
+                    command.append("--no-seed")
+                for pattern in args.only or []:
+                    command += ["--only", pattern]
+                if args.database:
+                    command += ["--database", args.database]
+                subprocess.run(command, check=True)
+                with open(output, encoding="utf-8") as file:
+                    datasets.update(json.load(file)["datasets"])
+    result = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "server": args.server,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency
+        },
+        "datasets": datasets
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=4)
+    if args.compare:
+        return report_comparison(args.compare, result, args.tolerance)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark every API route against seeded datasets."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bench = commands.add_parser("run", help="Run the benchmarks.")
+    bench.add_argument("--datasets", default="small",
+                       help="Comma separated datasets from "
+                       f"{', '.join(DATASETS)}.")
+    bench.add_argument("--no-seed", action="store_true",
+                       help="Use the data already in the database.")
+    bench.add_argument("--database",
+                       help="Database URI, defaults to"
+                       " BENCHMARK_DATABASE_URI.")
+    bench.add_argument("--requests", type=int, default=200,
+                       help="Timed requests per scenario.")
+    bench.add_argument("--warmup", type=int, default=20,
+                       help="Untimed requests sent before timing.")
+    bench.add_argument("--concurrency", type=int, default=4,
+                       help="Threads sending requests at once.")
+    bench.add_argument("--server", choices=["client", "wsgi"],
+                       default="client",
+                       help="Flask test client or a threaded WSGI server.")
+    bench.add_argument("--only", action="append",
+                       help="Run scenarios whose name contains this text.")
+    bench.add_argument("--output", help="Save the results as JSON.")
+    bench.add_argument("--compare", help="Baseline JSON to compare with.")
+    bench.add_argument("--tolerance", type=float, default=0.2,
+                       help="Allowed relative change before a regression.")
+
+    diff = commands.add_parser("compare", help="Compare two result files.")
+    diff.add_argument("baseline")
+    diff.add_argument("current")
+    diff.add_argument("--tolerance", type=float, default=0.2)
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.current, encoding="utf-8") as file:
+            current = json.load(file)
+        sys.exit(report_comparison(args.baseline, current, args.tolerance))
+
+    unknown = set(args.datasets.split(",")) - set(DATASETS)
+    if unknown and not args.no_seed:
+        parser.error(f"unknown datasets {', '.join(sorted(unknown))},"
+                     " other names only label --no-seed runs")
+    load_dotenv()
+    # the benchmark drops and reseeds its database, so it never falls
+    # back to the application's DATABASE_URI
+    database = args.database or os.getenv("BENCHMARK_DATABASE_URI")
+    if not database:
+        parser.error("set BENCHMARK_DATABASE_URI or pass --database")
+    os.environ["DATABASE_URI"] = database
+    os.environ.setdefault("JWT_SECRET_KEY", "benchmark")
+    # every request comes from one address, so the login throttle would
+    # otherwise answer most login requests with a 429
+    os.environ["LOGIN_IP_LIMIT"] = str(10 ** 9)
+    sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
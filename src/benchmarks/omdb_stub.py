@@ -0,0 +1,193 @@
+# in built imports for arguments, JSON fixtures, randomness, clocks and locks
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import zlib
+# external flask imports for the stand-in server
+from flask import Flask, request, jsonify
+
+# recorded OMDb responses replayed by the stand-in server
+DEFAULT_FIXTURES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "fixtures", "omdb.json"
+)
+GENRES = [
+    "Action", "Adventure", "Comedy", "Crime", "Drama",
+    "Fantasy", "Horror", "Romance", "Sci-Fi", "Thriller"
+]
+
+
+# load fixtures and index them by IMDb id and lower case title
+def load_fixtures(path):
+    with open(path, encoding="utf-8") as file:
+        records = json.load(file)
+    by_id = {record["imdbID"]: record for record in records}
+    by_title = {}
+    for record in records:
+        by_title.setdefault(record["Title"].lower(), []).append(record)
+    return by_id, by_title
+
+
+# build a plausible record for titles missing from the fixtures
+# so large imports can run against the stand-in
+def synthesize(title=None, imdb_id=None, media_type=None):
+    seed = zlib.crc32((imdb_id or title or "").lower().encode("utf-8"))
+    rng = random.Random(seed)
+    category = media_type or rng.choice(["movie", "movie", "series"])
+    imdb_id = imdb_id or f"tt{seed % 10000000:07d}"
+    title = title or f"Title {imdb_id}"
+    rating = round(rng.uniform(3, 9.5), 1)
+    record = {
+        "Title": title,
+        "Year": str(rng.randint(1950, 2024)),
+        "Genre": ", ".join(rng.sample(GENRES, 3)),
+        "Director": f"Director {rng.randint(1, 5000)}",
+        "Writer": f"Writer {rng.randint(1, 5000)}",
+        "Actors": ", ".join(
+            f"Actor {rng.randint(1, 50000)}" for _ in range(3)
+        ),
+        "Plot": f"A synthetic plot for {title}. " * rng.randint(1, 6),
+        "Country": rng.choice(["United States", "United Kingdom", "Canada"]),
+        "Ratings": [
+            {"Source": "Internet Movie Database", "Value": f"{rating}/10"}
+        ],
+        "Metascore": str(rng.randint(20, 99)),
+        "imdbID": imdb_id,
+        "Type": category,
+        "Response": "True"
+    }
+    if category == "movie":
+        record["BoxOffice"] = f"${rng.randint(10000, 900000000):,}"
+    return record
+
+
+# create the stand-in application
+def create_stub(fixtures, latency=0.0, jitter=0.0, error_rate=0.0,
+                rate_limit=0, synthesize_missing=False):
+    app = Flask(__name__)
+    by_id, by_title = load_fixtures(fixtures)
+    # requests counted in the current one second window
+    window = {"start": time.monotonic(), "count": 0}
+    window_lock = threading.Lock()
+
+    # reject requests over the per second limit
+    def over_limit():
+        if rate_limit <= 0:
+            return False
+        with window_lock:
+            now = time.monotonic()
+            if now - window["start"] >= 1:
+                window["start"] = now
+                window["count"] = 0
+            window["count"] += 1
+            return window["count"] > rate_limit
+
+    @app.route("/", methods=["GET"])
+    def omdb():
+        # simulate network and upstream processing time
+        delay = latency + random.uniform(0, jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if over_limit():
+            return jsonify(
+                {"Response": "False", "Error": "Request limit reached!"}
+            ), 429, {"Retry-After": "1"}
+        if error_rate and random.random() < error_rate:
+            return jsonify(
+                {"Response": "False", "Error": "Service unavailable"}
+            ), 503
+        imdb_id = request.args.get('i')
+        title = request.args.get('t')
+        media_type = request.args.get('type')
+        # find the recorded response the same way OMDb matches titles
+        if imdb_id:
+            candidates = [by_id[imdb_id]] if imdb_id in by_id else []
+        else:
+            candidates = by_title.get((title or "").strip().lower(), [])
+        if media_type:
+            candidates = [c for c in candidates if c["Type"] == media_type]
+        if candidates:
+            return jsonify(candidates[0]), 200
+        if synthesize_missing and (imdb_id or title):
+            return jsonify(synthesize(title, imdb_id, media_type)), 200
+        return jsonify(
+            {"Response": "False", "Error": "Movie not found!"}
+        ), 200
+
+    return app
+
+
+# fetch titles from the real OMDb and save them as fixtures
+def record(titles_path, fixtures):
+    from services import omdb_client
+    with open(titles_path, encoding="utf-8") as file:
+        titles = [line.strip() for line in file if line.strip()]
+    records = []
+    if os.path.exists(fixtures):
+        with open(fixtures, encoding="utf-8") as file:
+            records = json.load(file)
+    # position of each id so a recorded response replaces a
+    # hand-written fixture for the same title
+    known = {record["imdbID"]: i for i, record in enumerate(records)}
+    for title in titles:
+        if title.startswith("tt"):
+            data = omdb_client.fetch(imdb_id=title)
+        else:
+            data = omdb_client.fetch(title=title)
+        if data.get('Response') == 'False':
+            print(f"Not found: {title}")
+            continue
+        if data["imdbID"] in known:
+            records[known[data["imdbID"]]] = data
+        else:
+            known[data["imdbID"]] = len(records)
+            records.append(data)
+        print(f"Recorded {data['Title']} ({data['imdbID']})")
+    with open(fixtures, "w", encoding="utf-8") as file:
+        json.dump(records, file, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local OMDb stand-in for offline benchmarking."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Replay recorded responses.")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8081)
+    serve.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    serve.add_argument("--latency", type=float, default=0.0,
+                       help="Seconds added to every response.")
+    serve.add_argument("--jitter", type=float, default=0.0,
+                       help="Random extra seconds up to this value.")
+    serve.add_argument("--error-rate", type=float, default=0.0,
+                       help="Fraction of requests answered with a 503.")
+    serve.add_argument("--rate-limit", type=int, default=0,
+                       help="Requests per second before answering 429.")
+    serve.add_argument("--synthesize", action="store_true",
+                       help="Generate records for unknown titles.")
+
+    rec = commands.add_parser("record", help="Save real OMDb responses.")
+    rec.add_argument("titles", help="File with one title or IMDb id a line.")
+    rec.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.titles, args.fixtures)
+        return
+    app = create_stub(
+        args.fixtures,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        synthesize_missing=args.synthesize
+    )
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import date
 
+import click
 from flask import Blueprint
 
 from init import db, bcrypt
@@ -7,6 +12,11 @@ from models.user import User
 from models.media import Media
 from models.interaction import Interaction
 from models.comment import Comment
+from services import omdb_client, media_import, media_stats, similarity
+from services import media_activity, comment_store, token_versions
+from services import synthetic_data
+from services.omdb_client import OMDbError
+from services.rate_limiter import RateLimiter
 
 
 db_commands = Blueprint('db', __name__)
@@ -15,6 +25,11 @@ db_commands = Blueprint('db', __name__)
 @db_commands.cli.command('create')
 def create_tables():
     db.create_all()
+    # create_all skips existing tables, so add any indexes
+    # introduced since the tables were first created
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
     print("Tables created")
 
 
@@ -566,6 +581,8 @@ def seed_tables():
     ]
 
     db.session.add_all(media)
+    db.session.flush()
+    media_import.link_media(media)
 
     interactions = [
         Interaction(
@@ -704,5 +721,258 @@ def seed_tables():
 
     db.session.add_all(comments)
     db.session.commit()
+    media_stats.rebuild()
+    media_activity.rebuild()
+    comment_store.rebuild_counts()
 
     print("Tables seeded")
+
+
+@db_commands.cli.command('seed-synthetic')
+@click.option('--users', default=1000, show_default=True)
+@click.option('--media', default=1000, show_default=True)
+@click.option('--interactions', default=20000, show_default=True)
+@click.option('--comments', default=5000, show_default=True)
+@click.option('--password', default="password", show_default=True,
+              help="Password shared by every synthetic user.")
+@click.option('--seed', 'random_seed', type=int, default=None,
+              help="Random seed for a repeatable dataset.")
+@click.option('--batch-size', default=synthetic_data.BATCH_SIZE,
+              show_default=True, help="Rows sent per COPY statement.")
+def seed_synthetic(users, media, interactions, comments, password,
+                   random_seed, batch_size):
+    # load skewed synthetic data with COPY for load testing
+    started = time.monotonic()
+    counts = synthetic_data.seed(
+        users, media, interactions, comments, password=password,
+        random_seed=random_seed, batch_size=batch_size
+    )
+    for table, count in counts.items():
+        print(f"{count} {table} rows loaded")
+    print(f"Loaded in {time.monotonic() - started:.1f}s, rebuilding totals")
+    media_stats.rebuild()
+    media_activity.rebuild()
+    comment_store.rebuild_counts()
+    print(f"Tables seeded in {time.monotonic() - started:.1f}s")
+
+
+@db_commands.cli.command('rebuild-stats')
+def rebuild_stats():
+    # recalculate every media total from the interaction table
+    media_stats.rebuild()
+    print("Media stats rebuilt")
+
+
+@db_commands.cli.command('check-stats')
+def check_stats():
+    # report media whose stored totals differ from the interactions
+    drifted = media_stats.drift()
+    for row in drifted:
+        differences = ", ".join(
+            f"{name} {getattr(row, f'stored_{name}')} != "
+            f"{getattr(row, f'actual_{name}')}"
+            for name in media_stats.COUNTERS
+            if getattr(row, f'stored_{name}') != getattr(row, f'actual_{name}')
+        )
+        print(f"Media {row.media_id}: {differences}")
+    if drifted:
+        print(f"{len(drifted)} media records have drifted,"
+              " run flask db rebuild-stats to fix them")
+    else:
+        print("Media stats match interactions")
+
+
+@db_commands.cli.command('set-admin')
+@click.argument('username')
+@click.option('--revoke', is_flag=True, help="Remove admin status.")
+def set_admin(username, revoke):
+    user = db.session.scalar(db.select(User).filter_by(username=username))
+    if user is None:
+        print(f"User {username} not found")
+        return
+    user.is_admin = not revoke
+    # tokens carry the old admin status so they are all invalidated,
+    # other workers reject them once their cached version expires
+    token_versions.revoke(user.id)
+    db.session.commit()
+    print(f"{username} is {'no longer' if revoke else 'now'} an admin,"
+          " existing tokens have been revoked")
+
+
+@db_commands.cli.command('rebuild-comment-counts')
+def rebuild_comment_counts():
+    # recalculate the stored comment and reply counts
+    comment_store.rebuild_counts()
+    print("Comment counts rebuilt")
+
+
+@db_commands.cli.command('rebuild-activity')
+def rebuild_activity():
+    # refill the trending buckets from the interaction table
+    media_activity.rebuild()
+    print("Media activity rebuilt")
+
+
+@db_commands.cli.command('prune-activity')
+def prune_activity():
+    # drop buckets older than the longest trending window
+    deleted = media_activity.prune()
+    print(f"{deleted} activity buckets pruned")
+
+
+@db_commands.cli.command('link-credits')
+@click.option('--batch-size', default=1000, show_default=True)
+def link_credits(batch_size):
+    # fill the genre and people tables from the flat media strings
+    # of records stored before they existed
+    linked = 0
+    last_id = 0
+    while True:
+        media = db.session.scalars(
+            db.select(Media)
+            .filter(Media.id > last_id)
+            .order_by(Media.id)
+            .limit(batch_size)
+        ).all()
+        if not media:
+            break
+        last_id = media[-1].id
+        media_import.link_media(media)
+        db.session.commit()
+        linked += len(media)
+        print(f"{linked} media records linked")
+    print("Credits linked")
+
+
+@db_commands.cli.command('build-similarity')
+@click.option('--full', is_flag=True,
+              help="Recompute every media record instead of only those"
+              " touched since the previous build.")
+@click.option('--neighbours', default=similarity.NEIGHBOURS,
+              show_default=True, help="Similar media stored per record.")
+@click.option('--method', default=similarity.COSINE, show_default=True,
+              type=click.Choice([similarity.COSINE,
+                                 similarity.ADJUSTED_COSINE]))
+def build_similarity(full, neighbours, method):
+    # precompute the similar media served by /media/<id>/similar
+    started = time.monotonic()
+    recomputed, written = similarity.build(
+        full=full, k=neighbours, method=method
+    )
+    print(f"{recomputed} media records recomputed, {written} neighbours"
+          f" stored in {time.monotonic() - started:.1f}s")
+
+
+# matches IMDb ids such as tt0371746
+IMDB_ID_PATTERN = re.compile(r"^tt\d+$")
+
+
+def fetch_entry(entry, limiter):
+    # wait for a free slot so the import stays under the rate limit
+    limiter.acquire()
+    if IMDB_ID_PATTERN.match(entry):
+        return omdb_client.fetch(imdb_id=entry)
+    return omdb_client.fetch(title=entry)
+
+
+def read_entries(path):
+    # one title or IMDb id per line, blank lines and duplicates ignored
+    with open(path, encoding="utf-8") as file:
+        entries = [line.strip() for line in file]
+    return list(dict.fromkeys(entry for entry in entries if entry))
+
+
+def read_checkpoint(path):
+    # entries already stored or resolved by a previous run
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as file:
+        return {line.rstrip("\n") for line in file if line.strip()}
+
+
+@db_commands.cli.command('import-omdb')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--workers', default=8, show_default=True,
+              help="Number of concurrent OMDb requests.")
+@click.option('--rps', default=5.0, show_default=True,
+              help="Maximum OMDb requests per second, 0 for no limit.")
+@click.option('--batch-size', default=500, show_default=True,
+              help="Rows inserted per database statement.")
+@click.option('--checkpoint', type=click.Path(dir_okay=False),
+              help="Checkpoint file, defaults to PATH.checkpoint.")
+def import_omdb(path, workers, rps, batch_size, checkpoint):
+    checkpoint = checkpoint or f"{path}.checkpoint"
+    done = read_checkpoint(checkpoint)
+    pending = [entry for entry in read_entries(path) if entry not in done]
+    total = len(pending)
+    print(f"Importing {total} titles ({len(done)} already in checkpoint)")
+
+    limiter = RateLimiter(rps)
+    counts = {"inserted": 0, "existing": 0, "not_found": 0, "failed": 0}
+    # rows waiting to be inserted and the entries they resolve
+    rows = []
+    resolved = []
+    processed = 0
+    started = time.monotonic()
+
+    def flush():
+        # insert the batch then record its entries as done, so entries
+        # are only skipped on restart once their rows are committed
+        inserted = media_import.insert_media_batch(rows)
+        counts["inserted"] += inserted
+        counts["existing"] += len(rows) - inserted
+        with open(checkpoint, "a", encoding="utf-8") as file:
+            file.writelines(f"{entry}\n" for entry in resolved)
+        rows.clear()
+        resolved.clear()
+        rate = processed / max(time.monotonic() - started, 1e-9)
+        print(
+            f"{processed}/{total} processed, "
+            f"{counts['inserted']} inserted, "
+            f"{counts['existing']} already stored, "
+            f"{counts['not_found']} not found, "
+            f"{counts['failed']} failed ({rate:.1f}/s)"
+        )
+
+    entries = iter(pending)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # keep a bounded number of requests queued so large files
+        # do not create a future for every line up front
+        in_flight = {}
+        for entry in entries:
+            in_flight[executor.submit(fetch_entry, entry, limiter)] = entry
+            if len(in_flight) >= workers * 2:
+                break
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                entry = in_flight.pop(future)
+                processed += 1
+                try:
+                    data = future.result()
+                except OMDbError as err:
+                    # failed entries stay out of the checkpoint and
+                    # are retried by the next run
+                    counts["failed"] += 1
+                    print(f"Failed to fetch {entry}: {err}")
+                else:
+                    category = data.get('Type')
+                    if data.get('Response') == 'False' or (
+                        category not in ('movie', 'series')
+                    ):
+                        counts["not_found"] += 1
+                    else:
+                        rows.append(
+                            media_import.media_from_omdb(data, category)
+                        )
+                    resolved.append(entry)
+                # top the queue back up with the next entry
+                next_entry = next(entries, None)
+                if next_entry is not None:
+                    in_flight[
+                        executor.submit(fetch_entry, next_entry, limiter)
+                    ] = next_entry
+            if len(rows) >= batch_size or len(resolved) >= batch_size:
+                flush()
+    flush()
+    print("Import complete")
@@ -1,126 +1,304 @@
 
-from collections import defaultdict
 # external imports for flask and SQLAlchemy
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 # from sqlalchemy import or_
-from sqlalchemy.sql import func
-from sqlalchemy.orm import joinedload
+from sqlalchemy import true
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import func, literal
 from sqlalchemy.orm.exc import NoResultFound
 # local imports for SQLAlchemy, models and schemas
 from init import db
 from models.comment import Comment, comment_schema
 from models.user import User
 from models.media import Media, MediaEnum
+from services import comment_store
+from services.pagination import page_args, page_of, int_arg, encode_cursor
+from services.pagination import MAX_CURSOR
 
 # define a blueprint for comment URL endpoint
 comment_bp = Blueprint('comment', __name__, url_prefix='/comment')
+# default and largest number of reply levels shown below a comment
+DEFAULT_MAX_DEPTH = 5
+MAX_DEPTH = 20
+# default and largest number of replies shown for each comment
+DEFAULT_MAX_CHILDREN = 20
+MAX_CHILDREN = 100
 
 
-# GET route to view comments made for any media
-# or by any user
-@comment_bp.route("/", methods=["GET"])
-def get_comments():
-    # retrieve query parameters
-    username = request.args.get('username')
-    title = request.args.get('title')
-    # initialise query to fetch comments
-    # with related child comments
-    query = Comment.query.options(
-        joinedload(Comment.user),
-        joinedload(Comment.media),
-        joinedload(Comment.children)
+# read the depth and fan-out limits from the query parameters
+def thread_args():
+    max_depth = int_arg('max_depth', DEFAULT_MAX_DEPTH, 0, MAX_DEPTH)
+    max_children = int_arg(
+        'max_children', DEFAULT_MAX_CHILDREN, 1, MAX_CHILDREN
     )
-    # check for username parameter
+    return max_depth, max_children
+
+
+# read the username, title and media id filters from the query
+# parameters, shared by comment listings and reply pages so the
+# more_replies cursors of a filtered listing continue the same view
+def filter_args():
+    return {
+        "username": request.args.get('username'),
+        "title": request.args.get('title'),
+        # a media id that is not a whole number is a bad request
+        # rather than a missing filter
+        "media_id": int_arg('media_id', None, 1, MAX_CURSOR)
+        if 'media_id' in request.args else None
+    }
+
+
+# conditions for comments made by a user, on a title or on a media
+# record, the user and media are looked up once by subqueries
+def comment_filters(model, username=None, title=None, media_id=None):
+    conditions = []
     if username:
-        # query database to find the user
-        user = User.query.filter_by(username=username).first()
-        # return a not found response if no user is found
-        if not user:
-            return jsonify(
-                {
-                    "Error": f"Username {username} not found."
-                }
-            ), 404
-        # query database to find comments made by the user
-        filtered_query = query.join(
-                Comment.user
-            ).filter(
+        conditions.append(
+            model.user_id == db.select(User.id).filter(
                 User.username == username
-            )
-        # return not found response if no result is found
-        if filtered_query.first() is None:
-            return jsonify(
-                {
-                    "Error": f"No comments found from user {username}."
-                }
-            ), 404
-        # apply filter to query
-        query = filtered_query
-    # check for title parameter
+            ).scalar_subquery()
+        )
     if title:
-        # find title in the database
-        media = Media.query.filter(
-                func.lower(Media.title) == func.lower(title)
-            ).first()
-        # return not found error if not in the database
-        if not media:
-            return jsonify(
-                {
-                    "Error": f"Title {title} not found."
-                }
-            ), 404
-        # search database for comments from the title
-        filtered_query = query.join(
-                Comment.media
-            ).filter(
-                func.lower(Media.title) == func.lower(title)
+        conditions.append(
+            model.media_id.in_(
+                db.select(Media.id).filter(
+                    func.lower(Media.title) == func.lower(title)
+                )
             )
-        # return error if no comments are found
-        if filtered_query.first() is None:
-            return jsonify(
-                {
-                    "Error": f"No comments found for {title}."
-                }
-            ), 404
-        # apply filter
-        query = filtered_query
-    # apply filtered search value to comments
-    comments = query.all()
-    # organise into a dictionary to make
-    # parent comment id a key with child comments being value
-    comments_by_parent = defaultdict(list)
-    for comment in comments:
-        comments_by_parent[comment.parent_id].append(comment)
+        )
+    if media_id is not None:
+        conditions.append(model.media_id == media_id)
+    return conditions
+
+
+# fetch the threads below the given comments in one recursive query,
+# keeping the first max_children replies of each comment down to
+# max_depth levels, with the number of replies each comment has
+def load_threads(root_ids, max_depth, max_children, **filters):
+    tree = db.select(
+        Comment.id, literal(0).label("depth")
+    ).filter(
+        Comment.id.in_(root_ids)
+    ).cte("tree", recursive=True)
+    # the first replies of each comment already in the tree
+    replies = db.select(Comment.id).filter(
+        Comment.parent_id == tree.c.id,
+        *comment_filters(Comment, **filters)
+    ).order_by(Comment.id).limit(max_children).lateral("replies")
+    tree = tree.union_all(
+        db.select(replies.c.id, tree.c.depth + 1).select_from(
+            tree
+        ).join(
+            replies, true()
+        ).filter(tree.c.depth < max_depth)
+    )
+    # count the replies of every comment shown, truncated or not,
+    # the stored count holds every reply so is used without filters
+    counted = aliased(Comment)
+    conditions = comment_filters(counted, **filters)
+    reply_count = db.select(func.count()).select_from(counted).filter(
+        counted.parent_id == Comment.id, *conditions
+    ).scalar_subquery() if conditions else Comment.reply_count
+    # fetch the comments with the user and media fields shown
+    return db.session.execute(
+        db.select(
+            Comment.id,
+            Comment.content,
+            Comment.created,
+            Comment.parent_id,
+            User.username,
+            Media.title,
+            Media.category,
+            reply_count.label("reply_count")
+        ).join(
+            tree, tree.c.id == Comment.id
+        ).join(
+            User, User.id == Comment.user_id
+        ).join(
+            Media, Media.id == Comment.media_id
+        ).order_by(tree.c.depth, Comment.id)
+    ).all()
+
 
-    # nested recursive function used to serialise child comments
-    def serialise_comment(comment):
-        return {
-            # media record values are stored in the key value pairs
-            "id": comment.id,
-            "content": comment.content,
-            "created": comment.created.strftime("%Y-%m-%d T%H:%M"),
+# nest thread rows under their parents without recursion, rows are
+# ordered by depth so every parent is seen before its replies
+def serialise_threads(rows, root_ids):
+    roots = set(root_ids)
+    nodes = {}
+    for row in rows:
+        node = {
+            "id": row.id,
+            "content": row.content,
+            "created": row.created.strftime("%Y-%m-%d T%H:%M"),
             "user": {
-                "username": comment.user.username
+                "username": row.username
                 },
             "media": {
-                "title": comment.media.title,
-                "category": comment.media.category.name
+                "title": row.title,
+                "category": row.category.name
                 },
-            # runs function recursively for each child comment
-            "children": [
-                serialise_comment(child) for child in comments_by_parent[
-                    comment.id
-                    ]
-                ]
+            "reply_count": row.reply_count,
+            "children": [],
+            # cursor for /comment/<id>/replies when replies were cut
+            # off by the depth or fan-out limit
+            "more_replies": None
+        }
+        nodes[row.id] = node
+        parent = nodes.get(row.parent_id)
+        if parent is not None and row.id not in roots:
+            parent["children"].append(node)
+    for node in nodes.values():
+        shown = node["children"]
+        if node["reply_count"] > len(shown):
+            node["more_replies"] = encode_cursor(
+                shown[-1]["id"] if shown else 0
+            )
+    return [nodes[root_id] for root_id in root_ids if root_id in nodes]
+
+
+# GET route to view comments made for any media
+# or by any user
+@comment_bp.route("/", methods=["GET"])
+def get_comments():
+    # retrieve query parameters
+    filters = filter_args()
+    username = filters["username"]
+    title = filters["title"]
+    media_id = filters["media_id"]
+    # page size and cursor of the last top level comment returned
+    limit, after = page_args()
+    # limits on how much of each thread is shown
+    max_depth, max_children = thread_args()
+    # conditions applied to top level comments and their replies
+    conditions = comment_filters(Comment, **filters)
+    # fetch the next page of top level comments in id order with
+    # one extra row to know if another page exists
+    roots_query = db.select(Comment.id).filter(
+        Comment.parent_id.is_(None), *conditions
+    )
+    if after is not None:
+        roots_query = roots_query.filter(Comment.id > after)
+    root_ids = db.session.scalars(
+        roots_query.order_by(Comment.id).limit(limit + 1)
+    ).all()
+    root_ids, next_cursor = page_of(root_ids, limit, lambda root_id: root_id)
+    # only when nothing matches on the first page, check which
+    # filter emptied the result with a single query of existence checks
+    if not root_ids and after is None and conditions:
+        checks = db.session.execute(
+            db.select(
+                db.select(User.id).filter(
+                    User.username == username
+                ).exists(),
+                db.select(Comment.id).join(Comment.user).filter(
+                    User.username == username
+                ).exists(),
+                db.select(Media.id).filter(
+                    func.lower(Media.title) == func.lower(title)
+                ).exists(),
+                db.select(Media.id).filter_by(id=media_id).exists(),
+                db.select(Comment.id).filter(*conditions).exists()
+            )
+        ).one()
+        (user_exists, user_has_comments, title_exists, media_exists,
+         any_match) = checks
+        if username:
+            # return a not found response if no user is found
+            if not user_exists:
+                return jsonify(
+                    {
+                        "Error": f"Username {username} not found."
+                    }
+                ), 404
+            # return not found response if the user has no comments
+            if not user_has_comments:
+                return jsonify(
+                    {
+                        "Error": f"No comments found from user {username}."
+                    }
+                ), 404
+        if title:
+            # return not found error if the title is not in the database
+            if not title_exists:
+                return jsonify(
+                    {
+                        "Error": f"Title {title} not found."
+                    }
+                ), 404
+            # return error if no comments are found for the title
+            if not any_match:
+                return jsonify(
+                    {
+                        "Error": f"No comments found for {title}."
+                    }
+                ), 404
+        if media_id is not None:
+            # return not found error if the media record does not exist
+            if not media_exists:
+                return jsonify(
+                    {
+                        "Error": f"Media with id {media_id} not found."
+                    }
+                ), 404
+            # return error if no comments are found for the media
+            if not any_match:
+                return jsonify(
+                    {
+                        "Error": f"No comments found for media {media_id}."
+                    }
+                ), 404
+    # walk down the threads of the page's top level comments in one
+    # recursive query, so the work depends only on those threads
+    rows = load_threads(root_ids, max_depth, max_children, **filters)
+    serialised_comments = serialise_threads(rows, root_ids)
+    # return JSON response with the cursor for the next page in a
+    # header so the response body stays a list
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return jsonify(serialised_comments), 200, headers
+
+
+# GET route for the next replies of a comment, continuing from the
+# more_replies cursor of a truncated thread
+@comment_bp.route("/<int:comment_id>/replies", methods=["GET"])
+def get_replies(comment_id):
+    # page size, cursor of the last reply returned and thread limits
+    limit, after = page_args(DEFAULT_MAX_CHILDREN, MAX_CHILDREN)
+    max_depth, max_children = thread_args()
+    # the filters of the listing the cursor came from, applied to
+    # every level so reply counts and pages match that listing
+    filters = filter_args()
+    # fetch the next page of direct replies in id order with
+    # one extra row to know if another page exists
+    query = db.select(Comment.id).filter(
+        Comment.parent_id == comment_id,
+        *comment_filters(Comment, **filters)
+    )
+    if after is not None:
+        query = query.filter(Comment.id > after)
+    reply_ids = db.session.scalars(
+        query.order_by(Comment.id).limit(limit + 1)
+    ).all()
+    reply_ids, next_cursor = page_of(
+        reply_ids, limit, lambda reply_id: reply_id
+    )
+    # return a not found response if the comment does not exist
+    if not reply_ids and db.session.scalar(
+        db.select(Comment.id).filter_by(id=comment_id)
+    ) is None:
+        return jsonify(
+            {
+                "Error": f"Cannot find comment with id {comment_id}."
+            }
+        ), 404
+    # load the threads below each reply with the same limits
+    rows = load_threads(reply_ids, max_depth, max_children, **filters)
+    return jsonify(
+        {
+            "replies": serialise_threads(rows, reply_ids),
+            "next": next_cursor
         }
-    # top level comments are serialised using recursive function
-    # this keeps replies nested within original comments
-    serialised_comments = [
-        serialise_comment(c) for c in comments if c.parent_id is None
-        ]
-    # return JSON response
-    return jsonify(serialised_comments)
+    ), 200
 
 
 # POST route to create new comments
@@ -176,8 +354,10 @@ def create_comment():
         media_id=media.id,
         parent_id=parent_id
     )
-    # add the instance to the database and commit
+    # add the instance to the database, count it on the media
+    # and parent comment in the same transaction and commit
     db.session.add(new_comment)
+    comment_store.record_created(media.id, parent_id)
     db.session.commit()
     # return a JSON response with the created comment record
     return jsonify(comment_schema.dump(new_comment)), 201
@@ -234,47 +414,32 @@ def delete_comment(comment_id):
     # get user id from JWT token
     current_user_id = get_jwt_identity()
 
-    try:
-        # search for a comment with the URL id belonging to the current user
-        comment_to_delete = db.session.scalar(
-            db.select(Comment)
-            .join(User)
-            .filter(Comment.id == comment_id, User.id == current_user_id)
-        )
-        # return none if no match is found
-    except NoResultFound:
-        comment_to_delete = None
-
+    # admin status is carried in the JWT token
+    is_admin = get_jwt().get("is_admin", False)
+    # search for a comment with the URL id, admins can delete any
+    # comment while other users must have written it
+    query = db.select(Comment).filter_by(id=comment_id)
+    if not is_admin:
+        query = query.filter(Comment.user_id == current_user_id)
+    comment_to_delete = db.session.scalar(query)
     if not comment_to_delete:
-        # check database for user admin status
-        current_user = db.session.scalar(
-            db.select(User)
-            .filter_by(id=current_user_id)
-        )
-        if current_user.is_admin:
-            # if the user is admin search the database for
-            # a comment with the specified id
-            comment_to_delete = db.session.scalar(
-                db.select(Comment)
-                .filter_by(id=comment_id)
-            )
-            # return not found response if no comment is found
-            if not comment_to_delete:
-                return jsonify(
-                    {
-                        "Error": f"Cannot find comment with id {comment_id}."
-                    }
-                ), 404
-        else:
-            # return a 403 error message if the user does not
-            # have admin status
+        # return not found response if no comment is found
+        if is_admin:
             return jsonify(
                 {
-                    "Error": "Not authorised to delete this comment."
+                    "Error": f"Cannot find comment with id {comment_id}."
                 }
-            ), 403
-    # delete the comment and commit the session
-    db.session.delete(comment_to_delete)
+            ), 404
+        # return a 403 error message if the user does not
+        # have admin status
+        return jsonify(
+            {
+                "Error": "Not authorised to delete this comment."
+            }
+        ), 403
+    # delete the comment with its replies, update the counts
+    # and commit the session
+    comment_store.delete_thread(comment_to_delete.id)
     db.session.commit()
     # return a JSON confirmation response
     return jsonify(
@@ -1,18 +1,31 @@
 # external imports for flask and SQLAlchemy
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from marshmallow import ValidationError
-from sqlalchemy import func, case
-from sqlalchemy.exc import DataError, IntegrityError, NoResultFound
+from sqlalchemy import func, or_
+from sqlalchemy.exc import DataError, IntegrityError
+from psycopg2 import errorcodes
 # local imports for SQLAlchemy, models and schemas
 from init import db
 from models.interaction import Interaction, interactions_partial_schema
 from models.interaction import interactions_schema, interaction_schema
+from models.interaction import interactions_import_schema
 from models.user import User
 from models.media import Media
+from models.media_stats import MediaStats
+from models.media_similarity import recommended_media_schema
+from services import interaction_store, recommender
+from services.pagination import int_arg
 
 # define blueprint for interaction URL endpoint
 interaction_bp = Blueprint('interaction', __name__, url_prefix='/interaction')
+# largest number of titles and ids accepted by the batch summary
+MAX_BATCH_SUMMARIES = 200
+# largest number of interactions accepted by the bulk import
+MAX_BULK_INTERACTIONS = 5000
+# default and largest number of recommendations returned
+DEFAULT_RECOMMENDATIONS = 20
+MAX_RECOMMENDATIONS = 100
 
 
 # GET request to show fltered interactions of a specific user
@@ -124,6 +137,35 @@ def get_media_interactions():
     return jsonify(interactions_schema.dump(interactions)), 200
 
 
+# select media records with their precomputed interaction totals
+def summary_query():
+    return db.select(
+        Media.id,
+        Media.title,
+        Media.category,
+        MediaStats.interaction_count,
+        MediaStats.watched_count,
+        MediaStats.watchlist_count,
+        MediaStats.rating_count,
+        MediaStats.rating_sum
+    ).outerjoin(
+        MediaStats
+    )
+
+
+# convert a summary row to a dictionary for the response
+def summary_result(summary):
+    return {
+        "title": summary.title,
+        "category": summary.category.value,
+        "watched_count": summary.watched_count,
+        "rating_count": summary.rating_count,
+        # average rating given by users from the running totals
+        "average_rating": summary.rating_sum / summary.rating_count if summary.rating_count else None,
+        "watchlist_count": summary.watchlist_count
+    }
+
+
 # GET request to retrieve total interactions on a media record
 @interaction_bp.route("/summary", methods=["GET"])
 def get_media_summary():
@@ -136,39 +178,22 @@ def get_media_summary():
                 "Error": "Title parameter is required."
             }
         ), 400
-    # query the database to find a media record matching title
-    media = Media.query.filter(
-        func.lower(Media.title) == func.lower(title)
-        ).first()
-    if not media:
+    # find the media record matching title together with its
+    # precomputed interaction totals in a single lookup
+    summary = db.session.execute(
+        summary_query().filter(
+            func.lower(Media.title) == func.lower(title)
+        ).limit(1)
+    ).first()
+    if not summary:
         # return a not found response if no record is found
         return jsonify(
             {
                 "Error": f"Title {title} not found."
             }
         ), 404
-    # query database to aggregate interaction data
-    summary = db.session.query(
-        Media.title,
-        Media.category,
-        # use count to get the total number of watched, watchlist, ratings
-        # use case for enum category differentiating
-        func.count(case((Interaction.watched == 'yes', 1), else_=0)
-                   ).label('watched_count'),
-        func.count(Interaction.rating).label('rating_count'),
-        # use avg to retrieve the average rating given by users
-        func.avg(Interaction.rating).label('average_rating'),
-        func.count(case((Interaction.watchlist == 'yes', 1), else_=0)
-                   ).label('watchlist_count')
-        ).join(
-            Interaction
-        ).filter(
-            Interaction.media_id == media.id
-        ).group_by(
-            Media.id
-        ).first()
 
-    if not summary:
+    if not summary.interaction_count:
         # return a not found response if no interactions exist
         return jsonify(
             {
@@ -176,105 +201,175 @@ def get_media_summary():
             }
         ), 404
     # convert summary data to dictionary for the response
-    result = {
-        "title": summary.title,
-        "category": summary.category.value,
-        "watched_count": summary.watched_count,
-        "rating_count": summary.rating_count,
-        "average_rating": float(summary.average_rating) if summary.average_rating else None,
-        "watchlist_count": summary.watchlist_count
-    }
+    result = summary_result(summary)
     # return a JSON response for result
     return jsonify(result), 200
 
 
+# POST request to retrieve the summaries of many media records at once
+@interaction_bp.route("/summary/batch", methods=["POST"])
+def get_media_summaries():
+    # retrieve lists of titles and media ids from the request body
+    body_data = request.get_json(silent=True) or {}
+    titles = body_data.get('titles', [])
+    media_ids = body_data.get('media_ids', [])
+    # check both values are lists of the right type
+    if (
+        not isinstance(titles, list)
+        or not isinstance(media_ids, list)
+        or not all(isinstance(title, str) for title in titles)
+        or not all(
+            isinstance(media_id, int) and not isinstance(media_id, bool)
+            for media_id in media_ids
+        )
+    ):
+        return jsonify(
+            {
+                "Error": "titles must be a list of strings and media_ids"
+                " a list of whole numbers."
+            }
+        ), 400
+    if not titles and not media_ids:
+        # return a bad request response if nothing was requested
+        return jsonify(
+            {
+                "Error": "At least one title or media id is required."
+            }
+        ), 400
+    if len(titles) + len(media_ids) > MAX_BATCH_SUMMARIES:
+        return jsonify(
+            {
+                "Error": f"No more than {MAX_BATCH_SUMMARIES} titles and"
+                " media ids can be requested at once."
+            }
+        ), 400
+    # fetch every requested record with its totals in one query
+    rows = db.session.execute(
+        summary_query().filter(
+            or_(
+                func.lower(Media.title).in_(
+                    [title.lower() for title in titles]
+                ),
+                Media.id.in_(media_ids)
+            )
+        ).order_by(Media.id)
+    ).all()
+    # index the rows by id and by lower case title, keeping the first
+    # match for a title like the single summary endpoint
+    by_id = {row.id: row for row in rows}
+    by_title = {}
+    for row in rows:
+        by_title.setdefault(row.title.lower(), row)
+    summaries = []
+    not_found = []
+    no_interactions = []
+    # report each requested item in the order it was requested
+    requested = [(title, by_title.get(title.lower())) for title in titles]
+    requested += [(media_id, by_id.get(media_id)) for media_id in media_ids]
+    for key, row in requested:
+        if row is None:
+            not_found.append(key)
+        elif not row.interaction_count:
+            no_interactions.append(key)
+        else:
+            summaries.append({"media_id": row.id, **summary_result(row)})
+    # return every summary together with the unmatched items
+    return jsonify(
+        {
+            "summaries": summaries,
+            "not_found": not_found,
+            "no_interactions": no_interactions
+        }
+    ), 200
+
+
 # POST and PATCH request for creating and updating interactions
 # on media records specified by id in the URL
 @interaction_bp.route("/<int:media_id>", methods=["POST", "PATCH"])
 # check for a valid JWT token
 @jwt_required()
 def interaction(media_id):
+    # get user identity from JWT token
+    current_user_id = get_jwt_identity()
+    # retrieve JSON data from request body
+    body_data = request.get_json()
+    try:
+        # deserialise and validate body request
+        interaction_schema.load(body_data)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
     try:
-        # get user identity from JWT token
-        current_user_id = get_jwt_identity()
-        # query the database to find the user
-        user = User.query.get(current_user_id)
-        # return 404 response if no user is found
-        if not user:
-            return jsonify(
-                {
-                    "Error": "User not found"
-                }
-            ), 404
-        # query the database to find the id of the
-        # media record specified in the URL
-        media = Media.query.get(media_id)
-        if not media:
-            # return not found response if no matching record is found
-            return jsonify(
-                {
-                    "Error": f"Media with id {media_id} could not be found"
-                }
-            ), 404
-        # retrieve JSON data from request body
-        body_data = request.get_json()
-        # query the database to see if the user has
-        # made an interaction record for this media
-        existing = Interaction.query.filter_by(
-            user_id=user.id, media_id=media.id
-            ).first()
-        
-        try:
-            # deserialise and validate body request
-            interaction_schema.load(body_data)
-        except ValidationError as err:
-            return jsonify(err.messages), 400
-        
         # check request method for POST
         if request.method == "POST":
+            # insert the interaction in a single statement, the
+            # unique user and media pair stops duplicates and the
+            # foreign keys confirm the user and media exist
+            row = interaction_store.create_interaction(
+                current_user_id, media_id, body_data
+            )
             # return a bad request response if the user
             # already has an interaction for the media record
-            if existing:
+            if row is None:
+                db.session.rollback()
                 return jsonify(
                     {
                         "Error": "Interaction already exists."
                         " Use PUT or PATCH to update."
                     }
                 ), 400
-            # if no interaction exists create a new instance
-            # based on data found in the request body
-            interaction = Interaction(
-                watched=body_data.get('watched'),
-                rating=body_data.get('rating'),
-                watchlist=body_data.get('watchlist'),
-                user=user,
-                media=media
-            )
-            # add the instance to the database
-            db.session.add(interaction)
+            status = 201
             # else used for PATCH request
         else:
-            # if no interaction record exists
-            # return a not found response
-            if not existing:
+            # update the interaction in a single statement
+            # using data found in the request body
+            row = interaction_store.update_interaction(
+                current_user_id, media_id, body_data
+            )
+            if row is None:
+                db.session.rollback()
+                # only when nothing was updated, check whether the
+                # user and media exist to explain why
+                user_exists, media_exists = db.session.execute(
+                    db.select(
+                        db.select(User.id).filter_by(
+                            id=current_user_id
+                        ).exists(),
+                        db.select(Media.id).filter_by(
+                            id=media_id
+                        ).exists()
+                    )
+                ).one()
+                if not user_exists:
+                    return jsonify(
+                        {
+                            "Error": "User not found"
+                        }
+                    ), 404
+                if not media_exists:
+                    return jsonify(
+                        {
+                            "Error": f"Media with id {media_id}"
+                            " could not be found"
+                        }
+                    ), 404
+                # if no interaction record exists
+                # return a not found response
                 return jsonify(
                     {
                         "Error": "No interaction found. Use POST to create."
                     }
                 ), 404
-            # if an interaction is found update it
-            # using data found in the request body
-            existing.watched = body_data.get('watched', existing.watched)
-            existing.rating = body_data.get('rating', existing.rating)
-            existing.watchlist = body_data.get('watchlist', existing.watchlist)
+            status = 200
         # commit the session
         db.session.commit()
-        # if existing return a successful response
-        if existing:
-            return jsonify(interaction_schema.dump(existing)), 200
-        # if a new interaction record is created return a created status code
-        else:
-            return jsonify(interaction_schema.dump(interaction)), 201
+        # recommendations are rebuilt to include the change
+        recommender.invalidate()
+        # return the interaction with a created status code for
+        # new records and a successful one for updates
+        return jsonify(
+            interaction_schema.dump(interaction_store.display(row))
+        ), status
     # handle potential data error
     except DataError:
         # undo changes in the session
@@ -287,9 +382,22 @@ def interaction(media_id):
             }
         ), 422
     # handle potential integrity error
-    except IntegrityError:
+    except IntegrityError as err:
         # undo changes in the session
         db.session.rollback()
+        # a foreign key violation means the user or media is missing
+        if err.orig.pgcode == errorcodes.FOREIGN_KEY_VIOLATION:
+            if 'user_id' in err.orig.diag.constraint_name:
+                return jsonify(
+                    {
+                        "Error": "User not found"
+                    }
+                ), 404
+            return jsonify(
+                {
+                    "Error": f"Media with id {media_id} could not be found"
+                }
+            ), 404
         # return forbidden response when rating is not an integer
         return jsonify(
             {
@@ -298,61 +406,142 @@ def interaction(media_id):
         ), 422
 
 
-# DELETE request to handle the removal of a specified interaction record
-@interaction_bp.route("/<int:interaction_id>", methods=["DELETE"])
-# check for valid JWT token
+# POST request to create or update many interactions at once
+@interaction_bp.route("/bulk", methods=["POST"])
+# check for a valid JWT token
 @jwt_required()
-def delete_interaction(interaction_id):
-    # retrieve user identity from JWT token
+def bulk_interactions():
+    # get user identity from JWT token
     current_user_id = get_jwt_identity()
+    # retrieve the list of interactions from the request body
+    body_data = request.get_json()
+    if not isinstance(body_data, list) or not body_data:
+        return jsonify(
+            {
+                "Error": "Request body must be a list of interactions."
+            }
+        ), 400
+    if len(body_data) > MAX_BULK_INTERACTIONS:
+        return jsonify(
+            {
+                "Error": f"No more than {MAX_BULK_INTERACTIONS}"
+                " interactions can be imported at once."
+            }
+        ), 400
+    try:
+        # deserialise and validate the whole list before writing
+        items = interactions_import_schema.load(body_data)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
 
     try:
-        # find interaction by id
-        # check that it belongs to the current user
-        interaction_to_delete = db.session.scalar(
-            db.select(Interaction)
-            .join(User)
-            .filter(
-                Interaction.id == interaction_id,
-                User.id == current_user_id
-            )
-        )
-    # if the interaction is not found or belongs to another user
-    # set value to none
-    except NoResultFound:
-        interaction_to_delete = None
-    # if the result is None check the database to find the current user
-    if not interaction_to_delete:
-        current_user = db.session.scalar(
-            db.select(User)
-            .filter_by(id=current_user_id)
+        # write the items with multi-row statements per chunk and
+        # commit them together so none are written if any fail
+        results = interaction_store.upsert_interactions(
+            current_user_id, items
         )
-        # check the current users admin status
-        if current_user.is_admin:
-            # if user is admin find the interaction
-            # without filtering by user id
-            interaction_to_delete = db.session.scalar(
-                db.select(Interaction)
-                .filter_by(id=interaction_id)
-            )
-            # if no interaction is found return a not found response
-            if not interaction_to_delete:
+        db.session.commit()
+    # handle potential integrity error
+    except IntegrityError as err:
+        # undo changes in the session, nothing has been committed
+        db.session.rollback()
+        if err.orig.pgcode == errorcodes.FOREIGN_KEY_VIOLATION:
+            # a media record deleted while the items were written
+            if 'media_id' in (err.orig.diag.constraint_name or ''):
                 return jsonify(
                     {
-                        "Error": f"Interaction id {interaction_id} not found."
+                        "Error": "A media record was deleted during the"
+                        " import. No interactions were written,"
+                        " please try again."
                     }
-                ), 404
+                ), 409
+            # the user from the JWT token no longer exists
+            return jsonify(
+                {
+                    "Error": "User not found"
+                }
+            ), 404
+        raise
+    # recommendations are rebuilt to include the changes
+    recommender.invalidate()
+    # return a result for each item in the order it was sent
+    return jsonify({"results": results}), 200
 
-        else:
-            # if the user is not admin return a forbidden response
+
+# GET request for media the current user has not interacted with,
+# scored by the ratings of the most similar users
+@interaction_bp.route("/recommendations", methods=["GET"])
+# check for a valid JWT token
+@jwt_required()
+def get_recommendations():
+    # get user identity from JWT token
+    current_user_id = get_jwt_identity()
+    # optional location to only count similar users from
+    location = request.args.get('location')
+    # number of recommendations to return
+    limit = int_arg(
+        'limit', DEFAULT_RECOMMENDATIONS, 1, MAX_RECOMMENDATIONS
+    )
+    # score every media record with vector operations over the
+    # in-memory preference matrix instead of per user queries
+    model = recommender.get_model(current_app._get_current_object())
+    basis, scored = model.recommend(int(current_user_id), limit, location)
+    scores = dict(scored)
+    # fetch the display fields of the recommended media in one query
+    media = db.session.execute(
+        db.select(Media.id, Media.title, Media.year, Media.category)
+        .filter(Media.id.in_(list(scores)))
+    ).all()
+    by_id = {row.id: row._asdict() for row in media}
+    # keep the order of the scores, skipping media deleted since
+    # the model was built
+    result = [
+        {**by_id[media_id], "score": score}
+        for media_id, score in scored
+        if media_id in by_id
+    ]
+    return jsonify(
+        {
+            "basis": basis,
+            "recommendations": recommended_media_schema.dump(result)
+        }
+    ), 200
+
+
+# DELETE request to handle the removal of a specified interaction record
+@interaction_bp.route("/<int:interaction_id>", methods=["DELETE"])
+# check for valid JWT token
+@jwt_required()
+def delete_interaction(interaction_id):
+    # retrieve user identity from JWT token
+    current_user_id = get_jwt_identity()
+
+    # admin status is carried in the JWT token
+    is_admin = get_jwt().get("is_admin", False)
+    # delete the interaction by id in one statement that returns its
+    # values for the media totals, admins can delete any interaction
+    # while other users must own it
+    deleted = interaction_store.delete_interaction(
+        interaction_id, None if is_admin else current_user_id
+    )
+    if deleted is None:
+        # if no interaction is found return a not found response
+        if is_admin:
             return jsonify(
                 {
-                    "Error": "Not authorised to delete this interaction."
+                    "Error": f"Interaction id {interaction_id} not found."
                 }
-            ), 403
-    # delete the record and commit the session
-    db.session.delete(interaction_to_delete)
+            ), 404
+        # if the user is not admin return a forbidden response
+        return jsonify(
+            {
+                "Error": "Not authorised to delete this interaction."
+            }
+        ), 403
+    # commit the delete with the media totals
     db.session.commit()
+    # recommendations are rebuilt without the interaction
+    recommender.invalidate()
     # return a JSON response with a confirmation message
     return jsonify(
         {
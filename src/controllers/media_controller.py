@@ -1,24 +1,26 @@
-# in built imports for environment variables, requests, and decorator functions
-import os
-import requests
+# in built import for decorator functions
 import functools
 # external flask and SQLAlchemy imports for requests, JSON, JWT
 # and exceptions
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt
+from sqlalchemy import and_
 from sqlalchemy.sql import func
 from sqlalchemy.exc import DataError
 # local imports for SQLAlchemy, medels, and schemas
 from init import db
-from models.user import User
 from models.media import Media, media_schema, medias_schema
 from models.media import media_titles_schema, media_plots_schema
-from models.media import media_ratings_schema
+from models.media import media_ratings_schema, trending_media_schema
+from models.genre import Genre, media_genres
+from models.person import Person, MediaPerson
+from models.media_similarity import MediaSimilarity, similar_media_schema
+from services import media_activity, media_import, similarity
+from services.omdb_client import OMDbError
+from services.pagination import page_args, page_of, int_arg
 
 # blueprint for media URL endpoint
 media_bp = Blueprint('media', __name__, url_prefix='/media')
-# retrieves API key from .env variable
-api_key = os.getenv('OMDB_API_KEY')
 
 
 # wrapper function to check for admin status
@@ -27,14 +29,9 @@ def authorise_as_admin(fn):
     @functools.wraps(fn)
     # *args **kwargs used to accept positional and keyword arguments
     def wrapper(*args, **kwargs):
-        # get user identity from JWT token
-        user_id = get_jwt_identity()
-        # query database to select user
-        stmt = db.select(User).filter_by(id=user_id)
-        # store the query result as user value
-        user = db.session.scalar(stmt)
-        # check user for admin status
-        if user.is_admin:
+        # check the admin status carried in the JWT token, tokens
+        # from before a change of status are already rejected
+        if get_jwt().get("is_admin"):
             # call the original function with its arguments
             return fn(*args, **kwargs)
         # return error message with forbidden
@@ -49,6 +46,26 @@ def authorise_as_admin(fn):
     return wrapper
 
 
+# filter for media tagged with a genre, matched case insensitively
+# through the indexed genre join table
+def genre_filter(name):
+    return Media.id.in_(
+        db.select(media_genres.c.media_id).join(Genre).filter(
+            func.lower(Genre.name) == func.lower(name)
+        )
+    )
+
+
+# filter for media crediting a person in the given role
+def credit_filter(role, name):
+    return Media.id.in_(
+        db.select(MediaPerson.media_id).join(Person).filter(
+            MediaPerson.role == role,
+            func.lower(Person.name) == func.lower(name)
+        )
+    )
+
+
 # GET request to retrieve media records
 @media_bp.route("/", methods=["GET"])
 def get_media():
@@ -59,79 +76,21 @@ def get_media():
     genre = request.args.get('genre')
     actor = request.args.get('actor')
     director = request.args.get('director')
-    # initialise query before filtering
-    query = Media.query
-    try:
-        # check to see if series or movie is specified
-        if media_type:
-            # query the database to find records with matching category
-            query = query.filter(Media.category == media_type)
-        # check to see if genre is specified
-        if genre:
-            # query the database for genres matching the query parameter value
-            filtered_query = query.filter(Media.genre.ilike(f"%{genre}%"))
-            # if no matching genres are found return a 404 error message
-            if filtered_query.first() is None:
-                return jsonify(
-                    {
-                        "Error": f"Genre {genre} not found."
-                    }
-                ), 404
-            # add filtered query value to query variable
-            query = filtered_query
-        # check to see if an actor is specified
-        if actor:
-            # query the database to find a matching actor
-            filtered_query = query.filter(Media.actors.ilike(f"%{actor}%"))
-            if filtered_query.first() is None:
-                # return 404 error message if none is found
-                return jsonify(
-                    {
-                        "Error": f"Actor {actor} not found."
-                    }
-                ), 404
-            # apply filter to query
-            query = filtered_query
-
-        # check to see if a director is specified
-        if director:
-            # query database to find any matching director
-            filtered_query = query.filter(
-                    Media.director.ilike(f"%{director}%")
-                )
-            if filtered_query.first() is None:
-                # return error message if none are found
-                return jsonify(
-                    {
-                        "Error": f"Director {director} not found."
-                    }
-                ), 404
-            # apply filter to query variable
-            query = filtered_query
-        # after all filters are applied
-        # execute query to retrieve matching records
-        media = query.all()
-    # handle data errors
-    except DataError:
-        # return an error message with forbidden status code if
-        # media value violates enum constraint
-        return jsonify(
-            {
-                "Error": "Media must be either movie or series if specified."
-            }
-        ), 422
+    # the stored comment count is only selected when asked for
+    comments = request.args.get('comments')
+    # page size and cursor of the last record already returned
+    limit, after = page_args()
     # match case to determine displayed info
-    # return JSON object with appropriate schema
-    # based on info type parameter
+    # select the schema based on info type parameter
     match info_type:
         case 'title':
-            result = media_titles_schema.dump(media)
+            schema = media_titles_schema
         case 'plot':
-            result = media_plots_schema.dump(media)
+            schema = media_plots_schema
         case 'rating':
-            result = media_ratings_schema.dump(media)
+            schema = media_ratings_schema
         case 'all':
-            result = medias_schema.dump(media)
+            schema = medias_schema
             # returns forbidden status code if the info type
             # does not match one of the cases
         case _:
@@ -141,8 +100,85 @@ def get_media():
                     "title, plot, rating, or all"
                 }
             ), 422
-    # return JSON media record
-    return jsonify({"media": result}), 200
+    # initialise query with only the columns shown by the schema,
+    # rows are returned as tuples without building model instances
+    query = db.select(
+        *[
+            getattr(Media, field) for field in schema.opts.fields
+            if field != 'comment_count' or comments == 'yes'
+        ]
+    )
+    # conditions that do not produce an error when nothing matches
+    conditions = []
+    # filters applied in order with the error returned when
+    # a filter leaves no matching records
+    filters = []
+    # check to see if series or movie is specified
+    if media_type:
+        # query the database to find records with matching category
+        conditions.append(Media.category == media_type)
+    # check to see if genre is specified
+    if genre:
+        # filter for media tagged with the genre
+        filters.append((genre_filter(genre), f"Genre {genre} not found."))
+    # check to see if an actor is specified
+    if actor:
+        # filter for media crediting the actor
+        filters.append(
+            (credit_filter('actor', actor), f"Actor {actor} not found.")
+        )
+    # check to see if a director is specified
+    if director:
+        # filter for media crediting the director
+        filters.append(
+            (
+                credit_filter('director', director),
+                f"Director {director} not found."
+            )
+        )
+    # continue from the record after the cursor
+    if after is not None:
+        query = query.filter(Media.id > after)
+    try:
+        # apply every filter and execute the query in one round trip,
+        # fetching one extra row to know if another page exists
+        media = db.session.execute(
+            query.filter(
+                *conditions, *[f for f, _ in filters]
+            ).order_by(Media.id).limit(limit + 1)
+        ).all()
+        media, next_cursor = page_of(media, limit, lambda row: row.id)
+        # only when nothing matches on the first page, count the
+        # records left after each filter in a single aggregate to
+        # find the one that emptied the result
+        if not media and filters and after is None:
+            counts = db.session.execute(
+                db.select(
+                    *[
+                        func.count().filter(
+                            and_(*[f for f, _ in filters[:i + 1]])
+                        )
+                        for i in range(len(filters))
+                    ]
+                ).select_from(Media).filter(*conditions)
+            ).one()
+            # return a 404 error message for the first empty filter
+            for count, (_, error) in zip(counts, filters):
+                if count == 0:
+                    return jsonify({"Error": error}), 404
+    # handle data errors
+    except DataError:
+        # return an error message with forbidden status code if
+        # media value violates enum constraint
+        return jsonify(
+            {
+                "Error": "Media must be either movie or series if specified."
+            }
+        ), 422
+    # serialise the selected columns with the chosen schema
+    result = schema.dump(media)
+    # return JSON media record with the cursor for the next page
+    return jsonify({"media": result, "next": next_cursor}), 200
 
 
 # GET request for retrieving a single movie record
@@ -166,51 +202,37 @@ def get_movie():
     if movie:
         # return JSON response if a matching title is found
         return media_schema.dump(movie), 200
-    # use API key to retrieve data if
-    # the title is not found in the local database
-    response = requests.get(
-        f"http://www.omdbapi.com/?t={title}&type=movie&plot=full&apikey={api_key}"
-        )
-    # convert the response to JSON format and store in data variable
-    data = response.json()
+    # use the shared OMDb loader to retrieve and store the record if
+    # the title is not found in the local database, concurrent
+    # requests for the same title wait for a single OMDb request
+    try:
+        outcome, media_id, shared = media_import.fetch_media(title, 'movie')
+    # return a service unavailable response if OMDb cannot be reached
+    except OMDbError:
+        return jsonify(
+            {
+                "Error": "OMDb is currently unavailable, please try again."
+            }
+        ), 503
     # check to confirm that the record is a movie
-    if data.get('Type') == 'series':
+    if outcome == media_import.WRONG_TYPE:
         return jsonify(
             {
                 "Error": "This title corresponds to a TV series, not a movie."
             }
         ), 400
-
-    if response.status_code == 200 and data.get('Response') != 'False':
-        # convert JSON response and use to create a new
-        # media instance
-        data = response.json()
-        movie = Media(
-            title=data.get('Title'),
-            year=data.get('Year'),
-            category='movie',
-            genre=data.get('Genre'),
-            director=data.get('Director'),
-            writer=data.get('Writer'),
-            actors=data.get('Actors'),
-            plot=data.get('Plot'),
-            country=data.get('Country'),
-            ratings=data.get('Ratings'),
-            metascore=data.get('Metascore'),
-            box_office=data.get('BoxOffice', 0)
-        )
-        # store the retrieved instance in the local database
-        db.session.add(movie)
-        db.session.commit()
-        # return a JSON response
-        return media_schema.dump(movie), 201
     # return a not found error message if the title could not be found
-    else:
+    if outcome == media_import.NOT_FOUND:
         return jsonify(
             {
                 "Error": "Title could not be found"
             }
         ), 404
+    # load the stored record and return a JSON response, created
+    # only for the request that performed the OMDb fetch and insert
+    movie = db.session.get(Media, media_id)
+    created = outcome == media_import.CREATED and not shared
+    return media_schema.dump(movie), 201 if created else 200
 
 
 # GET route to retrieve a single tv series record
@@ -234,48 +256,127 @@ def get_tv():
     # if a record is found return a JSON response
     if media:
         return media_schema.dump(media), 200
-    # if not local record is found use API key to retrieve
-    # a third party record
-    response = requests.get(
-        f"http://www.omdbapi.com/?t={title}&type=series&plot=full&apikey={api_key}"
-        )
-    # convert third party record to JSON format
-    data = response.json()
+    # if not local record is found use the shared OMDb loader
+    # to retrieve and store a third party record
+    try:
+        outcome, media_id, shared = media_import.fetch_media(title, 'series')
+    # return a service unavailable response if OMDb cannot be reached
+    except OMDbError:
+        return jsonify(
+            {
+                "Error": "OMDb is currently unavailable, please try again."
+            }
+        ), 503
     # check to confirm the title is that of a tv series
-    if data.get('Type') == 'movie':
+    if outcome == media_import.WRONG_TYPE:
         return jsonify(
             {
                 "Error": "This title corresponds to a movie, not a TV series."
             }
         ), 400
-    # if a record of a tv series is found
-    if response.status_code == 200 and data.get('Response') != 'False':
-        # create a new media instance from the OMDb record
-        data = response.json()
-        tv = Media(
-            title=data.get('Title'),
-            year=data.get('Year'),
-            category='series',
-            genre=data.get('Genre'),
-            director=data.get('director'),
-            writer=data.get('Writer'),
-            actors=data.get('Actors'),
-            plot=data.get('Plot'),
-            country=data.get('Country'),
-            ratings=data.get('Ratings'),
-        )
-        # save that instance to the local database
-        db.session.add(tv)
-        db.session.commit()
-        # return the new record as a JSON response
-        return media_schema.dump(tv), 201
     # return a 404 error if no record of the title could be found
-    else:
+    if outcome == media_import.NOT_FOUND:
         return jsonify(
             {
                 "Error": "Title could not be found"
             }
         ), 404
+    # load the stored record and return it as a JSON response,
+    # created only for the request that inserted it
+    tv = db.session.get(Media, media_id)
+    created = outcome == media_import.CREATED and not shared
+    return media_schema.dump(tv), 201 if created else 200
+
+
+# GET request to show how often the OMDb negative cache saves a request
+@media_bp.route("/cache", methods=["GET"])
+@jwt_required()
+def get_cache_stats():
+    # return the hit and miss counters for this worker
+    return jsonify(
+        {
+            "negative_cache": media_import.negative_cache.stats(),
+            "title_cache": media_import.title_cache.stats()
+        }
+    ), 200
+
+
+# GET request for the media with the most activity in a recent window,
+# summed from the hourly activity buckets
+@media_bp.route("/trending", methods=["GET"])
+def get_trending_media():
+    # query parameters for the window, category and event to rank by
+    window = request.args.get('window', '7d')
+    category = request.args.get('category')
+    by = request.args.get('by', 'watched')
+    if window not in media_activity.WINDOWS:
+        return jsonify(
+            {
+                "Error": "Invalid window. Please specify either "
+                + ", ".join(media_activity.WINDOWS)
+            }
+        ), 422
+    if category and category not in ('movie', 'series'):
+        return jsonify(
+            {
+                "Error": "Category must be either movie or series"
+                " if specified."
+            }
+        ), 422
+    if by not in media_activity.EVENTS:
+        return jsonify(
+            {
+                "Error": "Invalid ranking. Please specify either "
+                + ", ".join(media_activity.EVENTS)
+            }
+        ), 422
+    # number of media to return, checked like the paginated routes
+    limit = int_arg('limit', 20, 1, 100)
+    # results are cached for a minute per set of parameters
+    trending = media_activity.trending(window, category, by, limit)
+    return jsonify(
+        {
+            "window": window,
+            "media": trending_media_schema.dump(trending)
+        }
+    ), 200
+
+
+# GET request for the media most similar to a media record,
+# read from the neighbours precomputed by flask db build-similarity
+@media_bp.route("/<int:media_id>/similar", methods=["GET"])
+def get_similar_media(media_id):
+    # number of similar media to return
+    limit = int_arg('limit', 10, 1, similarity.NEIGHBOURS)
+    # the stored neighbours are read in rank order from the primary key
+    similar = db.session.execute(
+        db.select(
+            Media.id,
+            Media.title,
+            Media.year,
+            Media.category,
+            MediaSimilarity.score
+        ).join(
+            MediaSimilarity, MediaSimilarity.similar_id == Media.id
+        ).filter(
+            MediaSimilarity.media_id == media_id
+        ).order_by(MediaSimilarity.rank).limit(limit)
+    ).all()
+    # an empty list is only an error when the media does not exist
+    if not similar and db.session.scalar(
+        db.select(Media.id).filter_by(id=media_id)
+    ) is None:
+        return jsonify(
+            {
+                "Error": f"Media with id {media_id} not found"
+            }
+        ), 404
+    return jsonify(
+        {
+            "media_id": media_id,
+            "similar": similar_media_schema.dump(similar)
+        }
+    ), 200
 
 
 # DELETE request for removal of media records
@@ -3,16 +3,18 @@ from datetime import timedelta
 # external imports for requests, responses and validation
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
 from sqlalchemy import or_
 from sqlalchemy.sql import func
 from sqlalchemy.exc import IntegrityError
 from psycopg2 import errorcodes
-from werkzeug.security import generate_password_hash
-# local imports for model, schemas, SQLAlchemy and bcrypt
-from init import db, bcrypt
+# local imports for model, schemas, SQLAlchemy and password hashing
+from init import db
 from models.user import User, user_schema, users_public_schema
 from models.user import user_schema_partial, user_registration_schema
+from services import passwords, token_versions
+from services.login_throttle import throttle
+from services.pagination import page_args, page_of
 # blueprint definition for url endpoint
 user_bp = Blueprint('user', __name__, url_prefix='/user')
 
@@ -20,12 +22,18 @@ user_bp = Blueprint('user', __name__, url_prefix='/user')
 # request to get all current users
 @user_bp.route("/", methods=["GET"])
 def get_all_users():
-    # query database and fetch all users
-    users = User.query.all()
+    # page size and cursor of the last user already returned
+    limit, after = page_args()
+    # query database for the next page of users in id order
+    query = User.query
+    if after is not None:
+        query = query.filter(User.id > after)
+    users = query.order_by(User.id).limit(limit + 1).all()
+    users, next_cursor = page_of(users, limit, lambda user: user.id)
     # serialise users into JSON objects based on schema
     result = users_public_schema.dump(users)
     # return result as a response with successful status code
-    return jsonify({"users": result}), 200
+    return jsonify({"users": result, "next": next_cursor}), 200
 
 
 # request to get all users from a specified location
@@ -79,10 +87,9 @@ def user_register():
             # location is an optional field
             location=body_data.get('location')
         )
-        # use bcrypt to hash the password from the body data
-        user.password = bcrypt.generate_password_hash(password).decode(
-                'utf-8'
-                )
+        # hash the password from the body data with bcrypt
+        # in the password pool
+        user.password = passwords.hash_password(password)
         # add and commit record to database
         db.session.add(user)
         db.session.commit()
@@ -131,20 +138,41 @@ def user_login():
     body_data = request.get_json()
     # retrive username or email from specified field
     login_field = body_data.get("username/email")
+    # refuse clients over the login limits before the
+    # database lookup and the bcrypt check
+    retry_after = throttle.attempt(login_field, request.remote_addr)
+    if retry_after is not None:
+        return jsonify(
+            {
+                "Error": "Too many login attempts. Please try again later."
+            }
+        ), 429, {"Retry-After": str(retry_after)}
     # find username or email to match login_field
     stmt = db.select(User).filter(
         or_(User.email == login_field, User.username == login_field)
         )
     # execute query and store result in user variable
     user = db.session.scalar(stmt)
-    # check for user and matching password
-    if user and bcrypt.check_password_hash(
+    # check for user and matching password, bcrypt runs
+    # in the password pool instead of the request thread
+    if user and passwords.check_password(
             user.password,
             body_data.get('password')
             ):
-        # create JWT token for user with expiry set for 7 days
+        # upgrade hashes stored at a lower cost or by werkzeug
+        if passwords.needs_rehash(user.password):
+            user.password = passwords.hash_password(
+                body_data.get('password')
+            )
+            db.session.commit()
+        # clear the failed logins counted for this username or email
+        # from this address
+        throttle.succeeded(login_field, request.remote_addr)
+        # create JWT token for user with expiry set for 7 days,
+        # carrying the admin status and token version in its claims
         token = create_access_token(
             identity=str(user.id),
+            additional_claims=token_versions.claims_for(user),
             expires_delta=timedelta(days=7)
             )
         # return user info with token as a JSON response
@@ -158,6 +186,9 @@ def user_login():
     # return an error and unauthorised status code
     # in the case of invalid fields
     else:
+        # count the failure against the username or email
+        # from this address
+        throttle.failed(login_field, request.remote_addr)
         return jsonify(
             {
                 "Error": "Username or password is invalid"
@@ -199,7 +230,9 @@ def edit_user():
             current_user.location = data['location']
         # hash new password before storing it within current_user
         if 'password' in data:
-            current_user.password = generate_password_hash(data['password'])
+            current_user.password = passwords.hash_password(
+                data['password']
+            )
         # commit the session
         db.session.commit()
         # return a message response if update is successful
@@ -241,22 +274,12 @@ def edit_user():
 # check for valid JWT token
 @jwt_required()
 def delete_user(user_id):
-    # get user identity from JWT token
-    current_user_id = get_jwt_identity()
-    # find user associated with current_user_id in database
-    stmt = db.select(User).filter_by(id=current_user_id)
-    # set query result as the value of current_user
-    current_user = db.session.scalar(stmt)
-    # return 404 error if no user is found
-    if not current_user:
-        return jsonify(
-            {
-                "Error": "User not found."
-            }
-        ), 404
-    # check to see if the user has admin status
-    # or matches the user to be deleted
-    if current_user.id == user_id or current_user.is_admin:
+    # get user identity from JWT token, tokens of deleted
+    # users are rejected before reaching the route
+    current_user_id = int(get_jwt_identity())
+    # check to see if the user has admin status from the JWT
+    # token or matches the user to be deleted
+    if current_user_id == user_id or get_jwt().get("is_admin"):
         # query database for the id specified in the URL
         user_to_delete = db.session.scalar(
             db.select(User)
@@ -266,6 +289,8 @@ def delete_user(user_id):
         if user_to_delete:
             db.session.delete(user_to_delete)
             db.session.commit()
+            # reject the deleted user's tokens on this worker at once
+            token_versions.forget(user_id)
             # return a successful response confirming which user was deleted
             return jsonify(
                 {
@@ -5,6 +5,8 @@ from flask import Flask
 from marshmallow.exceptions import ValidationError
 # local imports for app libraries
 from init import db, ma, jwt, bcrypt
+from services.pagination import PaginationError
+from services.passwords import PasswordPoolBusy
 
 
 def create_app():
@@ -14,6 +16,11 @@ def create_app():
     # configure environment variables
     app.config["SQLALCHEMY_DATABASE_URI"]=os.environ.get("DATABASE_URI")
     app.config["JWT_SECRET_KEY"]=os.environ.get("JWT_SECRET_KEY")
+    # bcrypt cost factor for new password hashes, lower stored
+    # costs are upgraded when the user next logs in
+    app.config["BCRYPT_LOG_ROUNDS"]=int(
+        os.environ.get("BCRYPT_LOG_ROUNDS", 12)
+    )
     # initialise app extensions
     db.init_app(app)
     ma.init_app(app)
@@ -40,6 +47,19 @@ def create_app():
     @app.errorhandler(ValidationError)
     def validation_error(error):
         return {"error": error.messages}, 400
+
+    @app.errorhandler(PaginationError)
+    def pagination_error(error):
+        return {"error": str(error)}, 400
+
+    @app.errorhandler(PasswordPoolBusy)
+    def password_pool_busy(error):
+        return {"error": str(error)}, 503, {"Retry-After": "1"}
+
+    # reject tokens of deleted users and tokens issued before a
+    # user's admin status changed
+    from services import token_versions
+    jwt.token_in_blocklist_loader(token_versions.is_revoked)
     # register blueprints for controllers
     from controllers.cli_controller import db_commands
     app.register_blueprint(db_commands)
@@ -1,5 +1,6 @@
-# external import for schema fields
+# external imports for schema fields and indexes
 from marshmallow import fields
+from sqlalchemy import Index
 # local imports for model relatins, SQLAlchemy and marshmallow
 from models.user import User
 from models.media import Media
@@ -15,9 +16,16 @@ class Comment(db.Model):
     content = db.Column(db.Text, nullable=False)
     created = db.Column(db.DateTime, default=db.func.current_timestamp())
     # establish foreign keys
-    parent_id = db.Column(db.Integer, db.ForeignKey('comments.id'))
+    parent_id = db.Column(
+        db.Integer, db.ForeignKey('comments.id', ondelete='CASCADE')
+    )
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     media_id = db.Column(db.Integer, db.ForeignKey('media.id'), nullable=False)
+    # number of direct replies, kept up to date when
+    # comments are created and deleted
+    reply_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
     # set relationships with other models
     parent = db.relationship(
         'Comment',
@@ -32,6 +40,17 @@ class Comment(db.Model):
         'Media',
         backref='comments'
     )
+    # indexes for paging the top level comments of one media record
+    # and for walking down a thread from parent to replies
+    __table_args__ = (
+        Index(
+            'ix_comments_media_roots',
+            media_id,
+            id,
+            postgresql_where=parent_id.is_(None)
+        ),
+        Index('ix_comments_parent_id', parent_id),
+    )
 
 
 # create schema class
@@ -64,7 +83,8 @@ class CommentSchema(ma.Schema):
             'user',
             'content',
             'created',
-            'parent_id'
+            'parent_id',
+            'reply_count'
         )
 
 
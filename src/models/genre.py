@@ -0,0 +1,42 @@
+# external imports for indexes and SQL functions
+from sqlalchemy import Index, func
+# local import for SQLAlchemy
+from init import db
+
+# association table linking media records to their genres
+media_genres = db.Table(
+    'media_genres',
+    db.Column(
+        'media_id',
+        db.Integer,
+        db.ForeignKey('media.id', ondelete='CASCADE'),
+        primary_key=True
+    ),
+    db.Column(
+        'genre_id',
+        db.Integer,
+        db.ForeignKey('genres.id', ondelete='CASCADE'),
+        primary_key=True
+    ),
+    # index for finding every media record in a genre
+    Index('ix_media_genres_genre_id', 'genre_id')
+)
+
+
+# create genre model
+class Genre(db.Model):
+    # set tablename to genres
+    __tablename__ = "genres"
+    # define columns and datatypes
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+    # establish relationship between genre and media
+    media = db.relationship(
+        'Media',
+        secondary=media_genres,
+        back_populates='genres'
+    )
+    # genre names are unique regardless of case
+    __table_args__ = (
+        Index('uq_genres_name', func.lower(name), unique=True),
+    )
@@ -3,7 +3,7 @@ import enum
 # external imports for schemas, enum and check constraint
 from marshmallow import fields, validate
 from marshmallow_enum import EnumField
-from sqlalchemy import CheckConstraint, Enum
+from sqlalchemy import CheckConstraint, Enum, UniqueConstraint, func
 # local imports for forein key schema, SQLAlchemy and marshmallow
 from .media import MediaSchema
 from init import db, ma
@@ -30,6 +30,20 @@ class Interaction(db.Model):
     # define foreign keys
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     media_id = db.Column(db.Integer, db.ForeignKey('media.id'), nullable=False)
+    # when the interaction was first created and last changed
+    created_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        default=func.now(),
+        server_default=func.now()
+    )
+    updated_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        default=func.now(),
+        server_default=func.now(),
+        onupdate=func.now()
+    )
     # set user and media relationship
     user = db.relationship(
         'User',
@@ -40,11 +54,14 @@ class Interaction(db.Model):
         back_populates='interactions'
     )
     # define check constraint for ratings to be between 0 - 10
+    # and allow only one interaction per user for each media record
     __table_args__ = (
-        (CheckConstraint(
+        CheckConstraint(
             'rating >= 0 AND rating <= 10', name='check_rating_range'
         ),
-        )
+        UniqueConstraint(
+            'user_id', 'media_id', name='uq_interaction_user_media'
+        ),
     )
 
 
@@ -85,3 +102,21 @@ class InteractionSchema(ma.Schema):
 interaction_schema = InteractionSchema()
 interactions_partial_schema = InteractionSchema(many=True, exclude=['user'])
 interactions_schema = InteractionSchema(many=True)
+
+
+# schema for validating bulk imports where each item names its media
+class InteractionImportSchema(InteractionSchema):
+    media_id = fields.Int(required=True)
+
+    class Meta:
+        fields = (
+            'media_id',
+            'watched',
+            'rating',
+            'watchlist'
+        )
+        ordered = True
+
+
+# instance for validating a list of imported interactions
+interactions_import_schema = InteractionImportSchema(many=True)
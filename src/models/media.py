@@ -1,7 +1,7 @@
 # built in import for enum categories
 import enum
 # ecternal imports for JSONB, enum and schemas
-from sqlalchemy import Enum
+from sqlalchemy import Enum, Index, func
 from sqlalchemy.dialects.postgresql import JSONB
 from marshmallow import fields
 from marshmallow_enum import EnumField
@@ -36,11 +36,38 @@ class Media(db.Model):
     ratings = db.Column(JSONB)
     metascore = db.Column(db.String)
     box_office = db.Column(db.String)
+    # number of comments on the record including replies,
+    # kept up to date when comments are created and deleted
+    comment_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
     # establish relationship between media and interaction
     interactions = db.relationship(
         'Interaction',
         back_populates='media'
     )
+    # normalised genres and credited people for indexed filtering
+    genres = db.relationship(
+        'Genre',
+        secondary='media_genres',
+        back_populates='media'
+    )
+    credits = db.relationship(
+        'MediaPerson',
+        back_populates='media',
+        cascade='all, delete-orphan',
+        passive_deletes=True
+    )
+    # unique index on the normalised title so concurrent inserts
+    # of the same title and category cannot create duplicate rows
+    __table_args__ = (
+        Index(
+            'uq_media_title_category',
+            func.lower(title),
+            category,
+            unique=True
+        ),
+    )
 
 
 # create schema class
@@ -66,7 +93,8 @@ class MediaSchema(ma.Schema):
             'country',
             'ratings',
             'metascore',
-            'box_office'
+            'box_office',
+            'comment_count'
         )
         # specify correct order
         ordered = True
@@ -85,7 +113,8 @@ class MediaTitleSchema(ma.Schema):
         fields = (
             'id',
             'title',
-            'category'
+            'category',
+            'comment_count'
         )
 
 
@@ -103,7 +132,8 @@ class MediaPlotSchema(ma.Schema):
             'title',
             'year',
             'category',
-            'plot'
+            'plot',
+            'comment_count'
         )
 
 
@@ -121,8 +151,30 @@ class MediaRatingSchema(ma.Schema):
             'year',
             'category',
             'ratings',
-            'metascore'
+            'metascore',
+            'comment_count'
         )
 
 
 media_ratings_schema = MediaRatingSchema(many=True)
+
+
+# schema for trending media with their activity in the window
+class MediaTrendingSchema(ma.Schema):
+    category = EnumField(MediaEnum, by_value=True)
+
+    class Meta:
+        fields = (
+            'id',
+            'title',
+            'year',
+            'category',
+            'interactions',
+            'watched',
+            'watchlisted',
+            'rated'
+        )
+        ordered = True
+
+
+trending_media_schema = MediaTrendingSchema(many=True)
@@ -0,0 +1,35 @@
+# external import for indexes
+from sqlalchemy import Index
+# local import for SQLAlchemy
+from init import db
+
+
+# hourly interaction activity per media record, kept up to date by
+# interaction writes and summed over a window for trending media
+class MediaActivity(db.Model):
+    # set tablename to media_activity
+    __tablename__ = "media_activity"
+    # one row per media record and hour with any activity
+    media_id = db.Column(
+        db.Integer,
+        db.ForeignKey('media.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    bucket = db.Column(db.DateTime(timezone=True), primary_key=True)
+    # number of each kind of event in the hour
+    interactions = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
+    watched = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
+    watchlisted = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
+    rated = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
+    # index for reading every bucket inside a window
+    __table_args__ = (
+        Index('ix_media_activity_bucket', bucket),
+    )
@@ -0,0 +1,71 @@
+# external imports for compact column types and schemas
+from sqlalchemy import Index, REAL, SmallInteger
+from marshmallow import fields
+from marshmallow_enum import EnumField
+# local imports for SQLAlchemy, marshmallow and the media enum
+from init import db, ma
+from .media import MediaEnum
+
+
+# precomputed nearest neighbours of each media record built from
+# the interaction matrix by flask db build-similarity
+class MediaSimilarity(db.Model):
+    # set tablename to media_similarity
+    __tablename__ = "media_similarity"
+    # each media record keeps its neighbours ordered by rank
+    media_id = db.Column(
+        db.Integer,
+        db.ForeignKey('media.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    rank = db.Column(SmallInteger, primary_key=True)
+    similar_id = db.Column(
+        db.Integer,
+        db.ForeignKey('media.id', ondelete='CASCADE'),
+        nullable=False
+    )
+    # four byte float is enough precision for ordering neighbours
+    score = db.Column(REAL, nullable=False)
+    # start of the run that computed the row, used for refreshes
+    computed_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    # index for finding the lists that include a changed media record
+    __table_args__ = (
+        Index('ix_media_similarity_similar_id', similar_id),
+    )
+
+
+# single row recording the last build, later refreshes recompute the
+# media changed since it started
+class SimilarityBuild(db.Model):
+    # set tablename to similarity_build
+    __tablename__ = "similarity_build"
+    # always 1, the table holds one row
+    id = db.Column(SmallInteger, primary_key=True, default=1)
+    # start of the last build, interactions written after it are
+    # picked up by the next refresh
+    started_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    # a refresh with other settings rebuilds everything
+    method = db.Column(db.String, nullable=False)
+    neighbours = db.Column(SmallInteger, nullable=False)
+
+
+# schema for similar media with their similarity score
+class SimilarMediaSchema(ma.Schema):
+    category = EnumField(MediaEnum, by_value=True)
+    score = fields.Float()
+
+    class Meta:
+        fields = (
+            'id',
+            'title',
+            'year',
+            'category',
+            'score'
+        )
+        ordered = True
+
+
+# instance for a list of similar media
+similar_media_schema = SimilarMediaSchema(many=True)
+# recommended media are shown with the same fields and their score
+recommended_media_schema = SimilarMediaSchema(many=True)
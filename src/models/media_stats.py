@@ -0,0 +1,40 @@
+# external import for SQL functions
+from sqlalchemy import func
+# local import for SQLAlchemy
+from init import db
+
+
+# per media interaction totals kept up to date by interaction writes
+class MediaStats(db.Model):
+    # set tablename to media_stats
+    __tablename__ = "media_stats"
+    # media id is both the primary key and a foreign key
+    media_id = db.Column(
+        db.Integer,
+        db.ForeignKey('media.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    # running totals for the interaction summary
+    interaction_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
+    watched_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
+    watchlist_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
+    rating_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
+    rating_sum = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
+    # last time an interaction write changed the totals, used to find
+    # the media whose similar media need recomputing
+    updated_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        default=func.now(),
+        server_default=func.now()
+    )
@@ -0,0 +1,62 @@
+# built in import for credit roles
+import enum
+# external imports for enum, indexes and SQL functions
+from sqlalchemy import Enum, Index, func
+# local import for SQLAlchemy
+from init import db
+
+
+# class for enum credit roles
+class PersonRoleEnum(enum.Enum):
+    actor = "actor"
+    director = "director"
+    writer = "writer"
+
+
+# create person model for actors, directors and writers
+class Person(db.Model):
+    # set tablename to people
+    __tablename__ = "people"
+    # define columns and datatypes
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String, nullable=False)
+    # establish relationship between person and their credits
+    credits = db.relationship(
+        'MediaPerson',
+        back_populates='person'
+    )
+    # names are unique regardless of case
+    __table_args__ = (
+        Index('uq_people_name', func.lower(name), unique=True),
+    )
+
+
+# association model linking people to media with their role
+class MediaPerson(db.Model):
+    # set tablename to media_people
+    __tablename__ = "media_people"
+    # composite primary key of media, person and role
+    media_id = db.Column(
+        db.Integer,
+        db.ForeignKey('media.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    person_id = db.Column(
+        db.Integer,
+        db.ForeignKey('people.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    role = db.Column(Enum(PersonRoleEnum), primary_key=True)
+    # set media and person relationships
+    media = db.relationship(
+        'Media',
+        back_populates='credits'
+    )
+    person = db.relationship(
+        'Person',
+        back_populates='credits'
+    )
+    # index for finding every media record a person is credited on
+    __table_args__ = (
+        Index('ix_media_people_person_role', person_id, role),
+    )
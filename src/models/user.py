@@ -17,6 +17,10 @@ class User(db.Model):
     password = db.Column(db.String, nullable=False)
     location = db.Column(db.String)
     is_admin = db.Column(db.Boolean, default=False)
+    # bumped to invalidate every token issued to the user
+    token_version = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0'
+    )
     # establish relationship between User and Interaction
     interactions = db.relationship(
         'Interaction',
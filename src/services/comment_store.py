@@ -0,0 +1,86 @@
+# external imports for SQL functions and aliases
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+# local imports for SQLAlchemy and models
+from init import db
+from models.comment import Comment
+from models.media import Media
+
+
+# add a new comment to the comment count of its media and the reply
+# count of its parent, run inside the transaction that inserts it
+def record_created(media_id, parent_id):
+    db.session.execute(
+        db.update(Media).where(Media.id == media_id).values(
+            comment_count=Media.comment_count + 1
+        )
+    )
+    if parent_id is not None:
+        db.session.execute(
+            db.update(Comment).where(Comment.id == parent_id).values(
+                reply_count=Comment.reply_count + 1
+            )
+        )
+
+
+# delete a comment and every reply below it in one statement and
+# remove them from the counts, returns the number of comments deleted
+def delete_thread(comment_id):
+    # every comment in the thread below the deleted one
+    thread = db.select(Comment.id).filter(
+        Comment.id == comment_id
+    ).cte("thread", recursive=True)
+    thread = thread.union_all(
+        db.select(Comment.id).join(thread, Comment.parent_id == thread.c.id)
+    )
+    deleted = db.session.execute(
+        db.delete(Comment).where(
+            Comment.id.in_(db.select(thread.c.id))
+        ).returning(Comment.id, Comment.media_id, Comment.parent_id),
+        execution_options={"synchronize_session": False}
+    ).all()
+    # replies may have been made on other media records
+    per_media = {}
+    for row in deleted:
+        per_media[row.media_id] = per_media.get(row.media_id, 0) + 1
+    for media_id, count in sorted(per_media.items()):
+        db.session.execute(
+            db.update(Media).where(Media.id == media_id).values(
+                comment_count=Media.comment_count - count
+            )
+        )
+    # only the deleted comment's own parent is left behind
+    parent_id = next(
+        (row.parent_id for row in deleted if row.id == comment_id), None
+    )
+    if parent_id is not None:
+        db.session.execute(
+            db.update(Comment).where(Comment.id == parent_id).values(
+                reply_count=Comment.reply_count - 1
+            )
+        )
+    return len(deleted)
+
+
+# recalculate every comment and reply count from the comments table
+def rebuild_counts():
+    replies = aliased(Comment)
+    db.session.execute(
+        db.update(Media).values(
+            comment_count=db.select(func.count()).select_from(
+                Comment
+            ).filter(
+                Comment.media_id == Media.id
+            ).scalar_subquery()
+        )
+    )
+    db.session.execute(
+        db.update(Comment).values(
+            reply_count=db.select(func.count()).select_from(
+                replies
+            ).filter(
+                replies.parent_id == Comment.id
+            ).scalar_subquery()
+        )
+    )
+    db.session.commit()
@@ -0,0 +1,292 @@
+# in built imports for grouping and simple value holders
+from collections import defaultdict
+from types import SimpleNamespace
+# external imports for SQL functions and postgres upserts
+from sqlalchemy import func, literal_column
+from sqlalchemy.dialects.postgresql import insert
+# local imports for SQLAlchemy, models and stats maintenance
+from init import db
+from models.interaction import Interaction
+from models.media import Media
+from models.user import User
+from services import media_activity, media_stats
+
+# interaction fields that can be written from a request body
+FIELDS = ("watched", "rating", "watchlist")
+# number of items written by each bulk upsert statement
+BULK_CHUNK_SIZE = 500
+
+
+# select a written interaction with the user and media fields shown
+# by the interaction schema, in the same statement as the write
+def _with_display_fields(written):
+    return db.select(
+        written,
+        User.username,
+        Media.title,
+        Media.year,
+        Media.category
+    ).join(
+        User, User.id == written.c.user_id
+    ).join(
+        Media, Media.id == written.c.media_id
+    )
+
+
+# insert an interaction unless the user already has one for the media,
+# returns the new row or None if it already exists
+def create_interaction(user_id, media_id, values):
+    # leave out missing values so column defaults apply
+    values = {
+        field: values[field] for field in FIELDS
+        if values.get(field) is not None
+    }
+    written = insert(Interaction).values(
+        user_id=user_id, media_id=media_id, **values
+    ).on_conflict_do_nothing(
+        index_elements=[Interaction.user_id, Interaction.media_id]
+    ).returning(
+        Interaction.id,
+        Interaction.user_id,
+        Interaction.media_id,
+        *[getattr(Interaction, field) for field in FIELDS]
+    ).cte("written")
+    row = db.session.execute(_with_display_fields(written)).first()
+    if row is not None:
+        # add the new interaction to the media totals
+        media_stats.apply_delta(
+            media_id,
+            media_stats.contribution(None),
+            media_stats.contribution(row)
+        )
+        # and to the activity of the current hour
+        media_activity.record({media_id: media_activity.events(None, row)})
+    return row
+
+
+# update the fields given for an existing interaction, returns the
+# updated row or None if the user has no interaction for the media
+def update_interaction(user_id, media_id, changes):
+    changes = {
+        field: changes[field] for field in FIELDS if field in changes
+    }
+    # lock the current row and keep its values for the stats change
+    previous = db.select(
+        Interaction.id,
+        *[getattr(Interaction, field) for field in FIELDS]
+    ).filter_by(
+        user_id=user_id, media_id=media_id
+    ).with_for_update().cte("previous")
+    written = db.update(Interaction).where(
+        Interaction.id == previous.c.id
+    ).values(
+        # stamp the change, an empty body still returns the interaction
+        **changes, updated_at=func.now()
+    ).returning(
+        Interaction.id,
+        Interaction.user_id,
+        Interaction.media_id,
+        *[getattr(Interaction, field) for field in FIELDS],
+        *[
+            getattr(previous.c, field).label(f"previous_{field}")
+            for field in FIELDS
+        ]
+    ).cte("written")
+    row = db.session.execute(_with_display_fields(written)).first()
+    if row is not None:
+        before = SimpleNamespace(
+            **{field: getattr(row, f"previous_{field}") for field in FIELDS}
+        )
+        # apply the change to the media totals
+        media_stats.apply_delta(
+            media_id,
+            media_stats.contribution(before),
+            media_stats.contribution(row)
+        )
+        media_activity.record({media_id: media_activity.events(before, row)})
+    return row
+
+
+# delete an interaction, limited to the user's own when a user id is
+# given, returns the deleted row or None if no interaction matched,
+# the row's values come from the delete itself so a concurrent update
+# or delete cannot change what is taken off the media totals
+def delete_interaction(interaction_id, user_id=None):
+    stmt = db.delete(Interaction).where(Interaction.id == interaction_id)
+    if user_id is not None:
+        stmt = stmt.where(Interaction.user_id == user_id)
+    row = db.session.execute(
+        stmt.returning(
+            Interaction.id,
+            Interaction.media_id,
+            *[getattr(Interaction, field) for field in FIELDS]
+        )
+    ).first()
+    if row is not None:
+        # remove the interaction from the media totals
+        media_stats.apply_delta(
+            row.media_id,
+            media_stats.contribution(row),
+            media_stats.contribution(None)
+        )
+    return row
+
+
+# insert or update many interactions for one user in the current
+# transaction and return a result for every item in the order given,
+# the caller commits so the request is written completely or not at all
+def upsert_interactions(user_id, items):
+    results = [None] * len(items)
+    for start in range(0, len(items), BULK_CHUNK_SIZE):
+        indexes = range(start, min(start + BULK_CHUNK_SIZE, len(items)))
+        _upsert_chunk(user_id, items, indexes, results)
+    return results
+
+
+# lock the user's existing interactions for the media ids and return
+# their current values keyed by media id, in media id order so
+# concurrent requests lock rows in the same order
+def _lock_existing(user_id, media_ids):
+    rows = db.session.execute(
+        db.select(
+            Interaction.media_id,
+            *[getattr(Interaction, field) for field in FIELDS]
+        ).filter(
+            Interaction.user_id == user_id,
+            Interaction.media_id.in_(media_ids)
+        ).order_by(Interaction.media_id).with_for_update()
+    ).all()
+    return {row.media_id: row for row in rows}
+
+
+# write rows for one set of fields, existing interactions are locked
+# first so their previous values are exact, missing ones are inserted
+# and any inserted concurrently in between are retried as updates,
+# returns (written row, previous values or None) pairs
+def _write_group(user_id, fields, rows):
+    written = []
+    pending = sorted(rows, key=lambda row: row["media_id"])
+    while pending:
+        previous = _lock_existing(
+            user_id, [row["media_id"] for row in pending]
+        )
+        existing = [row for row in pending if row["media_id"] in previous]
+        missing = [row for row in pending if row["media_id"] not in previous]
+        returning = (
+            Interaction.id,
+            Interaction.media_id,
+            *[getattr(Interaction, field) for field in FIELDS],
+            # xmax is zero for a row version this statement inserted
+            (literal_column("xmax") == 0).label("inserted")
+        )
+        if existing:
+            stmt = insert(Interaction).values(existing)
+            for row in db.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[Interaction.user_id, Interaction.media_id],
+                    # stamp the change, an item with no fields still
+                    # returns its interaction
+                    set_={
+                        **{
+                            field: getattr(stmt.excluded, field)
+                            for field in fields
+                        },
+                        "updated_at": func.now()
+                    }
+                ).returning(*returning)
+            ):
+                written.append(
+                    (row, None if row.inserted else previous[row.media_id])
+                )
+        pending = []
+        if missing:
+            inserted = db.session.execute(
+                insert(Interaction).values(missing).on_conflict_do_nothing(
+                    index_elements=[Interaction.user_id, Interaction.media_id]
+                ).returning(*returning)
+            ).all()
+            written.extend((row, None) for row in inserted)
+            # rows another request inserted after the lock are
+            # updated on the next pass with their values locked
+            done = {row.media_id for row in inserted}
+            pending = [row for row in missing if row["media_id"] not in done]
+    return written
+
+
+# write one chunk of bulk items with a multi-row statement per set of
+# fields provided, so missing fields keep their current values
+def _upsert_chunk(user_id, items, indexes, results):
+    # a media record can only be written once per statement,
+    # so the last item for each media id wins
+    latest = {}
+    for index in indexes:
+        media_id = items[index]["media_id"]
+        if media_id in latest:
+            results[latest[media_id]] = {
+                "media_id": media_id,
+                "status": "skipped",
+                "error": "Replaced by a later item for the same media."
+            }
+        latest[media_id] = index
+    # one lookup for the whole chunk so unknown media are reported
+    # per item instead of failing the statement
+    found = set(
+        db.session.scalars(
+            db.select(Media.id).filter(Media.id.in_(list(latest)))
+        )
+    )
+    groups = defaultdict(list)
+    for media_id, index in latest.items():
+        if media_id not in found:
+            results[index] = {
+                "media_id": media_id,
+                "status": "not_found",
+                "error": f"Media with id {media_id} could not be found"
+            }
+            continue
+        fields = tuple(field for field in FIELDS if field in items[index])
+        groups[fields].append(index)
+    deltas = defaultdict(lambda: dict.fromkeys(media_stats.COUNTERS, 0))
+    activity = {}
+    for fields, group in groups.items():
+        rows = [
+            {
+                "user_id": user_id,
+                "media_id": items[index]["media_id"],
+                **{field: items[index][field] for field in fields}
+            }
+            for index in group
+        ]
+        for row, before in _write_group(user_id, fields, rows):
+            delta = media_stats.difference(
+                media_stats.contribution(before),
+                media_stats.contribution(row)
+            )
+            for name, value in delta.items():
+                deltas[row.media_id][name] += value
+            activity[row.media_id] = media_activity.events(before, row)
+            results[latest[row.media_id]] = {
+                "media_id": row.media_id,
+                "id": row.id,
+                "status": "created" if before is None else "updated"
+            }
+    # apply the change to the media totals and the activity of the
+    # current hour with one statement each
+    media_stats.apply_deltas(deltas)
+    media_activity.record(activity)
+
+
+# shape a written row for the interaction schema
+def display(row):
+    return {
+        "id": row.id,
+        "media": {
+            "title": row.title,
+            "year": row.year,
+            "category": row.category
+        },
+        "watched": row.watched,
+        "rating": row.rating,
+        "watchlist": row.watchlist,
+        "user": {"username": row.username}
+    }
@@ -0,0 +1,203 @@
+# in built imports for environment variables, clocks, ids and locks
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# login attempts allowed from one client IP within the window
+IP_LIMIT = int(os.getenv('LOGIN_IP_LIMIT', 30))
+IP_WINDOW = float(os.getenv('LOGIN_IP_WINDOW', 60))
+# failed logins allowed for one username or email from one client IP
+# within the window
+IDENTITY_LIMIT = int(os.getenv('LOGIN_IDENTITY_LIMIT', 5))
+IDENTITY_WINDOW = float(os.getenv('LOGIN_IDENTITY_WINDOW', 300))
+# failed logins allowed for one username or email from every client IP
+# together, a higher cap against attempts spread over many addresses
+ACCOUNT_LIMIT = int(os.getenv('LOGIN_ACCOUNT_LIMIT', 50))
+ACCOUNT_WINDOW = float(os.getenv('LOGIN_ACCOUNT_WINDOW', 900))
+# most keys the in-memory backend tracks before evicting the oldest
+MAX_KEYS = int(os.getenv('LOGIN_THROTTLE_MAX_KEYS', 100000))
+
+
+# sliding window log per key held in this process, each key keeps
+# at most limit timestamps and the number of keys is capped
+class MemoryBackend:
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self._attempts = OrderedDict()
+        # reentrant so hit can check and add under one lock
+        self._lock = threading.RLock()
+
+    # attempts for a key still inside the window, oldest first
+    def _current(self, key, window, now):
+        attempts = self._attempts.get(key)
+        if attempts is None:
+            return None
+        while attempts and attempts[0] <= now - window:
+            attempts.popleft()
+        if not attempts:
+            del self._attempts[key]
+            return None
+        return attempts
+
+    # seconds until another attempt is allowed, or None when allowed
+    def check(self, key, limit, window):
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._current(key, window, now)
+            if attempts is None or len(attempts) < limit:
+                return None
+            return attempts[0] + window - now
+
+    # record an attempt for a key
+    def add(self, key, limit, window):
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._current(key, window, now)
+            if attempts is None:
+                attempts = self._attempts[key] = deque(maxlen=limit)
+            attempts.append(now)
+            self._attempts.move_to_end(key)
+            # forget the least recently used keys beyond the cap
+            while len(self._attempts) > self.max_keys:
+                self._attempts.popitem(last=False)
+
+    # record an attempt only if it is allowed, in one step
+    def hit(self, key, limit, window):
+        with self._lock:
+            retry_after = self.check(key, limit, window)
+            if retry_after is None:
+                self.add(key, limit, window)
+            return retry_after
+
+    # clear the attempts for a key
+    def reset(self, key):
+        with self._lock:
+            self._attempts.pop(key, None)
+
+
+# trims the window, then records the attempt only when the key is
+# under its limit, returning the seconds to wait otherwise, as one
+# script so concurrent workers cannot both pass the check
+HIT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1] - ARGV[2])
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    return tostring(oldest[2] + ARGV[2] - ARGV[1])
+end
+redis.call('ZADD', KEYS[1], ARGV[1], ARGV[4])
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[3]) - 1)
+redis.call('EXPIRE', KEYS[1], math.ceil(ARGV[2]))
+return false
+"""
+
+
+# sliding window log per key in a Redis sorted set, shared by every
+# gunicorn worker, needs the redis package installed
+class RedisBackend:
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self._hit = self.client.register_script(HIT_SCRIPT)
+
+    # seconds until another attempt is allowed, or None when allowed
+    def check(self, key, limit, window):
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.zremrangebyscore(key, 0, now - window)
+        pipe.zcard(key)
+        pipe.zrange(key, 0, 0, withscores=True)
+        _, count, oldest = pipe.execute()
+        if count < limit:
+            return None
+        return oldest[0][1] + window - now
+
+    # record an attempt for a key
+    def add(self, key, limit, window):
+        now = time.time()
+        pipe = self.client.pipeline()
+        pipe.zadd(key, {f"{now}:{uuid.uuid4().hex}": now})
+        # keep only the newest attempts a check can need
+        pipe.zremrangebyrank(key, 0, -limit - 1)
+        pipe.expire(key, math.ceil(window))
+        pipe.execute()
+
+    # record an attempt only if it is allowed, in one step
+    def hit(self, key, limit, window):
+        now = time.time()
+        retry_after = self._hit(
+            keys=[key],
+            args=[repr(now), window, limit, f"{now}:{uuid.uuid4().hex}"]
+        )
+        if retry_after is None:
+            return None
+        return float(retry_after)
+
+    # clear the attempts for a key
+    def reset(self, key):
+        self.client.delete(key)
+
+
+# limits login attempts per client IP and failed logins per identity,
+# both from each IP and from every IP together, the per IP count
+# stops one address quickly while the higher account wide count caps
+# attempts spread over many addresses
+class LoginThrottle:
+    def __init__(self, backend):
+        self.backend = backend
+
+    # seconds to wait before logging in again, or None when allowed,
+    # counts the attempt against the client IP when it is allowed
+    def attempt(self, identity, ip):
+        retry_after = None
+        for key, limit, window in self._identity_limits(identity, ip):
+            retry_after = self.backend.check(key, limit, window)
+            if retry_after is not None:
+                break
+        if retry_after is None:
+            retry_after = self.backend.hit(
+                f"login:ip:{ip}", IP_LIMIT, IP_WINDOW
+            )
+        if retry_after is None:
+            return None
+        return max(1, math.ceil(retry_after))
+
+    # count a failed login against the identity from this IP and
+    # against the identity from every IP
+    def failed(self, identity, ip):
+        for key, limit, window in self._identity_limits(identity, ip):
+            self.backend.add(key, limit, window)
+
+    # clear failed logins from this IP after a successful one, the
+    # account wide count is left to expire so a login by the owner
+    # does not reset the cap for attempts from other addresses
+    def succeeded(self, identity, ip):
+        self.backend.reset(self._identity_limits(identity, ip)[0][0])
+
+    # keys and limits for failed logins of an identity, the identity
+    # is kept exactly as given since the login lookup matches
+    # usernames and emails case sensitively
+    @staticmethod
+    def _identity_limits(identity, ip):
+        identity = identity or ''
+        return [
+            (
+                f"login:identity:{ip}:{identity}",
+                IDENTITY_LIMIT, IDENTITY_WINDOW
+            ),
+            (f"login:account:{identity}", ACCOUNT_LIMIT, ACCOUNT_WINDOW)
+        ]
+
+
+# the backend is chosen from the environment, Redis lets every
+# worker share counters and memory keeps them per process
+def _create_backend():
+    redis_url = os.getenv('LOGIN_THROTTLE_REDIS_URL')
+    if redis_url:
+        return RedisBackend(redis_url)
+    return MemoryBackend()
+
+
+throttle = LoginThrottle(_create_backend())
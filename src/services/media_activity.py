@@ -0,0 +1,140 @@
+# in built imports for time windows and environment variables
+import os
+from datetime import timedelta
+# external imports for postgres upserts and SQL expressions
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+# local imports for SQLAlchemy, models and caching
+from init import db
+from models.interaction import Interaction, InteractionEnum
+from models.media import Media
+from models.media_activity import MediaActivity
+from services import media_stats
+from services.ttl_cache import TTLCache
+
+# event columns counted in each hourly bucket
+EVENTS = ("interactions", "watched", "watchlisted", "rated")
+# windows accepted by the trending listing
+WINDOWS = {
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+    "30d": timedelta(days=30)
+}
+# trending results are reused for a minute before summing again
+trending_cache = TTLCache(
+    maxsize=int(os.getenv('TRENDING_CACHE_SIZE', 256)),
+    ttl=float(os.getenv('TRENDING_CACHE_TTL', 60))
+)
+
+
+# events caused by changing an interaction from before to after,
+# either may be None for a created or deleted interaction
+def events(before, after):
+    if after is None:
+        # removing an interaction does not undo activity
+        return dict.fromkeys(EVENTS, 0)
+    old = media_stats.contribution(before)
+    new = media_stats.contribution(after)
+    old_rating = before.rating if before is not None else None
+    return {
+        "interactions": int(before is None),
+        "watched": int(new["watched_count"] > old["watched_count"]),
+        "watchlisted": int(new["watchlist_count"] > old["watchlist_count"]),
+        "rated": int(
+            after.rating is not None and after.rating != old_rating
+        )
+    }
+
+
+# add events for many media records to the current hour in one
+# statement, run inside the transaction that writes the interactions
+def record(counts):
+    rows = [
+        {"media_id": media_id, **added}
+        for media_id, added in sorted(counts.items())
+        if any(added.values())
+    ]
+    if not rows:
+        return
+    stmt = insert(MediaActivity).values(
+        [{**row, "bucket": func.date_trunc('hour', func.now())}
+         for row in rows]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MediaActivity.media_id, MediaActivity.bucket],
+        set_={
+            name: getattr(MediaActivity, name) + getattr(stmt.excluded, name)
+            for name in EVENTS
+        }
+    )
+    db.session.execute(stmt)
+
+
+# media with the most events of one kind inside a window, summed
+# from the hourly buckets without reading the interaction table
+def trending(window, category=None, by="watched", limit=20):
+    key = (window, category, by, limit)
+    result = trending_cache.get(key)
+    if result is not None:
+        return result
+    totals = [
+        func.sum(getattr(MediaActivity, name)).label(name)
+        for name in EVENTS
+    ]
+    ranked = func.sum(getattr(MediaActivity, by))
+    query = db.select(
+        Media.id, Media.title, Media.year, Media.category, *totals
+    ).join(
+        Media, Media.id == MediaActivity.media_id
+    ).filter(
+        MediaActivity.bucket >= func.date_trunc(
+            'hour', func.now() - WINDOWS[window]
+        )
+    ).group_by(Media.id).having(ranked > 0)
+    if category:
+        query = query.filter(Media.category == category)
+    result = db.session.execute(
+        query.order_by(ranked.desc(), Media.id).limit(limit)
+    ).all()
+    trending_cache.set(key, result)
+    return result
+
+
+# refill the buckets from the interaction table, counting each
+# interaction's current state in the hour it was created
+def rebuild():
+    db.session.execute(db.delete(MediaActivity))
+    db.session.execute(
+        insert(MediaActivity).from_select(
+            ["media_id", "bucket", *EVENTS],
+            db.select(
+                Interaction.media_id,
+                func.date_trunc('hour', Interaction.created_at),
+                func.count(),
+                func.count().filter(
+                    Interaction.watched == InteractionEnum.yes
+                ),
+                func.count().filter(
+                    Interaction.watchlist == InteractionEnum.yes
+                ),
+                func.count(Interaction.rating)
+            ).group_by(
+                Interaction.media_id,
+                func.date_trunc('hour', Interaction.created_at)
+            )
+        )
+    )
+    db.session.commit()
+
+
+# remove buckets older than the longest window, returns the number
+def prune():
+    deleted = db.session.execute(
+        db.delete(MediaActivity).filter(
+            MediaActivity.bucket < func.date_trunc(
+                'hour', func.now() - max(WINDOWS.values())
+            )
+        )
+    ).rowcount
+    db.session.commit()
+    return deleted
@@ -0,0 +1,243 @@
+# in built import for environment variables
+import os
+# external imports for SQLAlchemy functions and postgres upserts
+from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import insert
+# local imports for SQLAlchemy, the media model and OMDb services
+from init import db
+from models.media import Media
+from models.genre import Genre, media_genres
+from models.person import Person, MediaPerson
+from services import omdb_client
+from services.single_flight import SingleFlight
+from services.ttl_cache import TTLCache
+
+# outcomes of fetching a title that is missing from the local database
+CREATED = "created"
+EXISTING = "existing"
+WRONG_TYPE = "wrong_type"
+NOT_FOUND = "not_found"
+
+# OMDb credit fields and the role they are stored with
+CREDIT_FIELDS = {
+    "actors": "actor",
+    "director": "director",
+    "writer": "writer"
+}
+
+# in-flight OMDb lookups keyed by normalised title and category
+_in_flight = SingleFlight()
+# titles OMDb could not find or returned as the other category,
+# answered locally until the entry expires
+negative_cache = TTLCache(
+    maxsize=int(os.getenv('OMDB_NEGATIVE_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('OMDB_NEGATIVE_CACHE_TTL', 3600))
+)
+# ids of records stored for titles as they were requested, which may
+# differ from the title OMDb returned, so a request that matched a
+# record by a different title does not fetch it from OMDb again
+title_cache = TTLCache(
+    maxsize=int(os.getenv('OMDB_TITLE_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('OMDB_TITLE_CACHE_TTL', 3600))
+)
+
+
+# normalise a title the same way as the func.lower lookups
+def normalise_title(title):
+    return title.strip().lower()
+
+
+# convert an OMDb record into media column values
+def media_from_omdb(data, category):
+    values = {
+        "title": data.get('Title'),
+        "year": data.get('Year'),
+        "category": category,
+        "genre": data.get('Genre'),
+        "director": data.get('Director'),
+        "writer": data.get('Writer'),
+        "actors": data.get('Actors'),
+        "plot": data.get('Plot'),
+        "country": data.get('Country'),
+        "ratings": data.get('Ratings'),
+        # only movies carry metascore and box office figures, the keys
+        # are always present so rows can share one multi-row insert
+        "metascore": None,
+        "box_office": None
+    }
+    if category == 'movie':
+        values["metascore"] = data.get('Metascore')
+        values["box_office"] = data.get('BoxOffice', 0)
+    return values
+
+
+# split an OMDb comma separated field into unique names
+def split_names(value):
+    names = {}
+    for name in (value or "").split(","):
+        name = name.strip()
+        if name and name != "N/A":
+            names.setdefault(name.lower(), name)
+    return list(names.values())
+
+
+# insert any missing names and return ids keyed by lower case name
+def _upsert_names(model, names):
+    if not names:
+        return {}
+    # sorted so concurrent imports lock rows in the same order
+    keys = sorted(names)
+    db.session.execute(
+        insert(model).values(
+            [{"name": names[key]} for key in keys]
+        ).on_conflict_do_nothing(index_elements=[func.lower(model.name)])
+    )
+    rows = db.session.execute(
+        db.select(model.id, func.lower(model.name)).filter(
+            func.lower(model.name).in_(keys)
+        )
+    ).all()
+    return {key: model_id for model_id, key in rows}
+
+
+# link media records to genre and person rows from their flat
+# OMDb strings, items are (media_id, column values) pairs
+def link_credits(items):
+    genre_names = {}
+    person_names = {}
+    links = []
+    for media_id, values in items:
+        genres = split_names(values.get("genre"))
+        credits = [
+            (role, name)
+            for field, role in CREDIT_FIELDS.items()
+            for name in split_names(values.get(field))
+        ]
+        for name in genres:
+            genre_names.setdefault(name.lower(), name)
+        for _, name in credits:
+            person_names.setdefault(name.lower(), name)
+        links.append((media_id, genres, credits))
+    # one upsert per table for the whole batch
+    genre_ids = _upsert_names(Genre, genre_names)
+    person_ids = _upsert_names(Person, person_names)
+    genre_rows = [
+        {"media_id": media_id, "genre_id": genre_ids[name.lower()]}
+        for media_id, genres, _ in links
+        for name in genres
+    ]
+    credit_rows = [
+        {
+            "media_id": media_id,
+            "person_id": person_ids[name.lower()],
+            "role": role
+        }
+        for media_id, _, credits in links
+        for role, name in credits
+    ]
+    if genre_rows:
+        db.session.execute(
+            insert(media_genres).values(genre_rows).on_conflict_do_nothing()
+        )
+    if credit_rows:
+        db.session.execute(
+            insert(MediaPerson).values(credit_rows).on_conflict_do_nothing()
+        )
+
+
+# link media model instances that already have ids
+def link_media(media):
+    fields = ("genre", *CREDIT_FIELDS)
+    link_credits(
+        [
+            (item.id, {field: getattr(item, field) for field in fields})
+            for item in media
+        ]
+    )
+
+
+# insert a media record unless the title and category already exist,
+# returns the id of the stored record and whether it was inserted
+def insert_media(values):
+    stmt = insert(Media).values(**values).on_conflict_do_nothing(
+        index_elements=[func.lower(Media.title), Media.category]
+    ).returning(Media.id)
+    media_id = db.session.scalar(stmt)
+    inserted = media_id is not None
+    if inserted:
+        link_credits([(media_id, values)])
+    # another request or worker stored the title first
+    else:
+        media_id = db.session.scalar(
+            db.select(Media.id).filter(
+                func.lower(Media.title) == func.lower(values["title"]),
+                Media.category == values["category"]
+            )
+        )
+    db.session.commit()
+    return media_id, inserted
+
+
+# insert many media records in one statement, skipping titles that
+# already exist, and return the number of rows inserted
+def insert_media_batch(rows):
+    if not rows:
+        return 0
+    stmt = insert(Media).values(rows).on_conflict_do_nothing(
+        index_elements=[func.lower(Media.title), Media.category]
+    ).returning(Media.id, Media.title, Media.category)
+    inserted = db.session.execute(stmt).all()
+    # match returned ids back to the values they were inserted from
+    by_key = {}
+    for values in rows:
+        by_key.setdefault(
+            (values["title"].lower(), values["category"]), values
+        )
+    link_credits(
+        [
+            (media_id, by_key[(title.lower(), category.value)])
+            for media_id, title, category in inserted
+        ]
+    )
+    db.session.commit()
+    return len(inserted)
+
+
+# fetch a title from OMDb and store it, returns an outcome and media id
+def _fetch_and_store(title, category):
+    data = omdb_client.fetch(title=title, media_type=category)
+    # OMDb can return a record of the other category
+    other_category = 'series' if category == 'movie' else 'movie'
+    if data.get('Type') == other_category:
+        return WRONG_TYPE, None
+    if data.get('Response') == 'False':
+        return NOT_FOUND, None
+    media_id, inserted = insert_media(media_from_omdb(data, category))
+    return (CREATED if inserted else EXISTING), media_id
+
+
+# fetch a missing title with concurrent misses coalesced into one
+# OMDb request, returns the outcome, media id and whether it was shared,
+# the outcome is CREATED only when this call inserted the record
+def fetch_media(title, category):
+    key = (normalise_title(title), category)
+    # answer known misses without a network request
+    outcome = negative_cache.get(key)
+    if outcome is not None:
+        return outcome, None, True
+    # answer titles already matched to a stored record, unless the
+    # record was deleted since
+    media_id = title_cache.get(key)
+    if media_id is not None:
+        if db.session.get(Media, media_id) is not None:
+            return EXISTING, media_id, True
+        title_cache.delete(key)
+    (outcome, media_id), shared = _in_flight.do(
+        key, _fetch_and_store, title, category
+    )
+    if media_id is not None:
+        title_cache.set(key, media_id)
+    # remember titles that cannot be stored so repeats skip OMDb
+    elif outcome in (WRONG_TYPE, NOT_FOUND):
+        negative_cache.set(key, outcome)
+    return outcome, media_id, shared
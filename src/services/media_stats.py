@@ -0,0 +1,133 @@
+# external imports for postgres upserts and SQL expressions
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+# local imports for SQLAlchemy and models
+from init import db
+from models.interaction import Interaction, InteractionEnum
+from models.media_stats import MediaStats
+
+# counter columns maintained from interaction rows
+COUNTERS = (
+    "interaction_count",
+    "watched_count",
+    "watchlist_count",
+    "rating_count",
+    "rating_sum"
+)
+
+
+# check an enum column value that may be a member or a string
+def _is_yes(value):
+    return value == InteractionEnum.yes or value == InteractionEnum.yes.value
+
+
+# what a single interaction adds to each counter
+def contribution(interaction):
+    if interaction is None:
+        return dict.fromkeys(COUNTERS, 0)
+    rating = interaction.rating
+    return {
+        "interaction_count": 1,
+        "watched_count": int(_is_yes(interaction.watched)),
+        "watchlist_count": int(_is_yes(interaction.watchlist)),
+        "rating_count": int(rating is not None),
+        "rating_sum": int(rating) if rating is not None else 0
+    }
+
+
+# difference between two contributions for each counter
+def difference(before, after):
+    return {name: after[name] - before[name] for name in COUNTERS}
+
+
+# add the difference between two contributions to the media totals,
+# run inside the transaction that writes the interaction
+def apply_delta(media_id, before, after):
+    apply_deltas({media_id: difference(before, after)})
+
+
+# add counter differences for many media records in one statement
+def apply_deltas(deltas):
+    rows = [
+        {"media_id": media_id, **delta}
+        for media_id, delta in sorted(deltas.items())
+        if any(delta.values())
+    ]
+    if not rows:
+        return
+    stmt = insert(MediaStats).values(rows)
+    # increment existing totals atomically so concurrent writes add up
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MediaStats.media_id],
+        set_={
+            **{
+                name: getattr(MediaStats, name) + getattr(stmt.excluded, name)
+                for name in COUNTERS
+            },
+            "updated_at": func.now()
+        }
+    )
+    db.session.execute(stmt)
+
+
+# select the totals calculated directly from the interaction table
+def _aggregate():
+    return db.select(
+        Interaction.media_id,
+        func.count().label("interaction_count"),
+        func.count().filter(
+            Interaction.watched == InteractionEnum.yes
+        ).label("watched_count"),
+        func.count().filter(
+            Interaction.watchlist == InteractionEnum.yes
+        ).label("watchlist_count"),
+        func.count(Interaction.rating).label("rating_count"),
+        func.coalesce(func.sum(Interaction.rating), 0).label("rating_sum")
+    ).group_by(Interaction.media_id)
+
+
+# replace every stored total with freshly calculated values
+def rebuild():
+    # block interaction writes until the new totals are committed
+    db.session.execute(db.text("LOCK TABLE interaction IN SHARE MODE"))
+    db.session.execute(db.delete(MediaStats))
+    aggregate = _aggregate().subquery()
+    db.session.execute(
+        insert(MediaStats).from_select(
+            ["media_id", *COUNTERS],
+            db.select(aggregate)
+        )
+    )
+    db.session.commit()
+
+
+# compare stored totals with calculated ones and return the media
+# ids whose totals differ with both sets of values
+def drift():
+    aggregate = _aggregate().subquery()
+    stored = db.select(MediaStats).subquery()
+    columns = [
+        func.coalesce(getattr(table.c, name), 0).label(f"{prefix}{name}")
+        for prefix, table in (("stored_", stored), ("actual_", aggregate))
+        for name in COUNTERS
+    ]
+    rows = db.session.execute(
+        db.select(
+            func.coalesce(stored.c.media_id, aggregate.c.media_id)
+            .label("media_id"),
+            *columns
+        ).select_from(
+            stored.join(
+                aggregate,
+                stored.c.media_id == aggregate.c.media_id,
+                full=True
+            )
+        )
+    ).all()
+    return [
+        row for row in rows
+        if any(
+            getattr(row, f"stored_{name}") != getattr(row, f"actual_{name}")
+            for name in COUNTERS
+        )
+    ]
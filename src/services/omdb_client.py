@@ -0,0 +1,102 @@
+# in built imports for environment variables, process ids and thread locks
+import os
+import threading
+# external imports for pooled HTTP sessions and retry policies
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# retrieves API key from .env variable
+api_key = os.getenv('OMDB_API_KEY')
+# base URL shared by every OMDb request, can point at a local stand-in
+OMDB_URL = os.getenv('OMDB_URL') or "http://www.omdbapi.com/"
+# seconds allowed to open a connection and to wait for a response
+CONNECT_TIMEOUT = float(os.getenv('OMDB_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.getenv('OMDB_READ_TIMEOUT', 10))
+# number of retries and the backoff between them
+MAX_RETRIES = int(os.getenv('OMDB_MAX_RETRIES', 3))
+BACKOFF_FACTOR = float(os.getenv('OMDB_BACKOFF_FACTOR', 0.3))
+# number of keep-alive connections held open in the pool
+POOL_SIZE = int(os.getenv('OMDB_POOL_SIZE', 10))
+
+# session is created lazily so each gunicorn worker gets its own pool
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+# exception raised when OMDb cannot be reached or responds with an error
+class OMDbError(Exception):
+    pass
+
+
+# create a session with a pooled adapter and bounded retries
+def _create_session():
+    # retry connection errors and transient server responses
+    # with exponential backoff between attempts
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(
+        pool_connections=POOL_SIZE,
+        pool_maxsize=POOL_SIZE,
+        max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# return the session for the current process
+def get_session():
+    global _session, _session_pid
+    # a forked worker must not reuse the parent's open sockets
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = _create_session()
+                _session_pid = os.getpid()
+    return _session
+
+
+# single place to build the OMDb query string parameters
+def build_params(title=None, imdb_id=None, media_type=None, plot="full"):
+    params = {"apikey": api_key, "plot": plot}
+    # IMDb ids take priority over titles when both are given
+    if imdb_id:
+        params["i"] = imdb_id
+    else:
+        params["t"] = title
+    if media_type:
+        params["type"] = media_type
+    return params
+
+
+# fetch a single OMDb record and return the decoded JSON body
+def fetch(title=None, imdb_id=None, media_type=None, plot="full"):
+    params = build_params(title, imdb_id, media_type, plot)
+    try:
+        response = get_session().get(
+            OMDB_URL,
+            params=params,
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+        )
+    # handle timeouts and connection errors once retries are exhausted
+    except requests.RequestException as err:
+        raise OMDbError(f"OMDb request failed: {err}") from err
+    # OMDb answers missing titles with a 200 so any other status is an error
+    if response.status_code != 200:
+        raise OMDbError(
+            f"OMDb responded with status code {response.status_code}"
+        )
+    try:
+        return response.json()
+    except ValueError as err:
+        raise OMDbError("OMDb returned an invalid response") from err
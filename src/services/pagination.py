@@ -0,0 +1,71 @@
+# in built imports for encoding cursor tokens
+import base64
+import binascii
+import json
+# external flask import for query parameters
+from flask import request
+
+# number of records returned when no limit is given and the largest allowed
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# largest primary key a cursor can hold, the top of the bigint range
+MAX_CURSOR = 2 ** 63 - 1
+
+
+# exception raised for invalid limit or cursor parameters
+class PaginationError(ValueError):
+    pass
+
+
+# encode the sort key of the last record into an opaque token
+def encode_cursor(value):
+    raw = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+# decode a token created by encode_cursor
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, ValueError, UnicodeError) as err:
+        raise PaginationError("Invalid cursor.") from err
+
+
+# read a whole number query parameter within a range
+def int_arg(name, default, minimum, maximum):
+    value = request.args.get(name, default)
+    label = name.replace('_', ' ').capitalize()
+    try:
+        value = int(value)
+    except (TypeError, ValueError) as err:
+        raise PaginationError(f"{label} must be a whole number.") from err
+    if value < minimum or value > maximum:
+        raise PaginationError(
+            f"{label} must be between {minimum} and {maximum}."
+        )
+    return value
+
+
+# read the limit and after query parameters from the request
+def page_args(default=DEFAULT_LIMIT, maximum=MAX_LIMIT):
+    limit = int_arg('limit', default, 1, maximum)
+    after = request.args.get('after')
+    if after is not None:
+        after = decode_cursor(after)
+        # cursors for these listings hold an integer primary key,
+        # bool is a subclass of int and the key must fit a bigint
+        if (
+            not isinstance(after, int) or isinstance(after, bool)
+            or not 0 <= after <= MAX_CURSOR
+        ):
+            raise PaginationError("Invalid cursor.")
+    return limit, after
+
+
+# trim a result fetched with limit + 1 rows and build the next cursor
+def page_of(rows, limit, key):
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(key(rows[-1]))
+    return rows, None
@@ -0,0 +1,130 @@
+# in built imports for environment variables, process pools and locks
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeout
+from concurrent.futures.process import BrokenProcessPool
+# external imports for hashing and the application config
+import bcrypt
+from flask import current_app
+from werkzeug.security import check_password_hash as check_werkzeug_hash
+
+# number of processes hashing passwords in each server worker
+POOL_SIZE = int(
+    os.getenv('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1))
+)
+# hashes queued or running at once before new requests are refused
+MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', POOL_SIZE * 8))
+# seconds a request waits for a queue slot and for its result
+QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', 2))
+RESULT_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+
+# pool is created lazily so each gunicorn worker gets its own processes
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+
+# exception raised when the pool is too busy to take another hash
+class PasswordPoolBusy(Exception):
+    pass
+
+
+# hash a password with bcrypt, run in a pool process
+def _hash(password, rounds):
+    salt = bcrypt.gensalt(rounds)
+    return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
+
+
+# check a password against a stored hash, run in a pool process
+def _check(hashed, password):
+    if hashed.startswith("$2"):
+        return bcrypt.checkpw(
+            password.encode("utf-8"), hashed.encode("utf-8")
+        )
+    # hashes stored by werkzeug before every update used bcrypt
+    return check_werkzeug_hash(hashed, password)
+
+
+# return the pool for the current process
+def _get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                # spawned processes do not inherit the server's threads,
+                # sockets or database connections
+                _pool = ProcessPoolExecutor(
+                    max_workers=POOL_SIZE,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
+# forget a broken pool so the next hash starts a new one
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# run a function in the pool and wait for its result, so the CPU cost
+# stays off the thread serving other requests
+def _run(fn, *args):
+    if not _pending.acquire(timeout=QUEUE_TIMEOUT):
+        raise PasswordPoolBusy("Too many password checks in progress.")
+    future = None
+    for _ in range(2):
+        pool = _get_pool()
+        try:
+            future = pool.submit(fn, *args)
+            break
+        # a broken pool raises BrokenProcessPool, a RuntimeError, and so
+        # does a pool another thread shut down after discarding it,
+        # either way the pool is replaced and the job submitted again
+        except RuntimeError:
+            _discard_pool(pool)
+    if future is None:
+        _pending.release()
+        raise PasswordPoolBusy("Password hashing is restarting.")
+    # the slot is freed when the job finishes, not when the request
+    # stops waiting, so timed out jobs still count against the bound
+    future.add_done_callback(lambda _: _pending.release())
+    try:
+        return future.result(timeout=RESULT_TIMEOUT)
+    except FuturesTimeout:
+        raise PasswordPoolBusy("Password check timed out.")
+    except BrokenProcessPool:
+        # a pool process died, start a new pool for later requests
+        _discard_pool(pool)
+        raise PasswordPoolBusy("Password hashing is restarting.")
+
+
+# bcrypt cost factor configured in create_app
+def rounds():
+    return current_app.config["BCRYPT_LOG_ROUNDS"]
+
+
+# hash a password at the configured cost factor
+def hash_password(password):
+    return _run(_hash, password, rounds())
+
+
+# check a password against a stored hash
+def check_password(hashed, password):
+    if not hashed or password is None:
+        return False
+    return _run(_check, hashed, password)
+
+
+# whether a stored hash should be replaced after a successful login,
+# true for other algorithms and for bcrypt below the configured cost
+def needs_rehash(hashed):
+    if not hashed.startswith("$2"):
+        return True
+    return int(hashed.split("$")[2]) < rounds()
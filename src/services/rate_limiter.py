@@ -0,0 +1,24 @@
+# in built imports for clocks and thread locks
+import threading
+import time
+
+
+# spaces calls evenly so no more than rate calls start per second
+# across every thread sharing the limiter
+class RateLimiter:
+    def __init__(self, rate):
+        # a rate of zero or less disables the limit
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    # block until the caller is allowed to start its next call
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            # reserve the next free slot for this caller
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,196 @@
+# in built imports for environment variables, clocks and threads
+import os
+import threading
+import time
+# external imports for the in-memory preference matrix
+import numpy as np
+from scipy import sparse
+# local imports for SQLAlchemy, the user model and preference loading
+from init import db
+from models.user import User
+from services.similarity import load_preferences, user_means
+
+# number of most similar users whose ratings are combined
+NEIGHBOURS = int(os.getenv('RECOMMENDER_NEIGHBOURS', 50))
+# seconds before a model is rebuilt even without a local write,
+# so writes handled by other workers are picked up
+MAX_AGE = float(os.getenv('RECOMMENDER_MAX_AGE', 300))
+# shortest time between rebuilds while writes keep arriving
+MIN_REBUILD_INTERVAL = float(os.getenv('RECOMMENDER_MIN_REBUILD', 30))
+# how a recommendation was scored
+SIMILAR_USERS = "similar_users"
+POPULAR = "popular"
+
+
+# immutable snapshot of every user's preferences held in memory
+class PreferenceModel:
+    def __init__(self, user_ids, rows, media_ids, columns, values,
+                 locations):
+        shape = (len(user_ids), len(media_ids))
+        self.media_ids = media_ids
+        self.user_index = {
+            int(user_id): i for i, user_id in enumerate(user_ids)
+        }
+        # lower case location of each user row for neighbour filters
+        self.locations = locations
+        self.means = user_means(rows, values, len(user_ids))
+        # ratings relative to each user's mean for predictions
+        self.centred = sparse.csr_matrix(
+            (values - self.means[rows], (rows, columns)),
+            shape=shape, dtype=np.float32
+        )
+        # which media each user has an interaction with
+        self.seen = sparse.csr_matrix(
+            (np.ones(len(values), dtype=np.float32), (rows, columns)),
+            shape=shape
+        )
+        # preferences scaled to unit length per user so one sparse
+        # product gives the cosine similarity to every other user
+        raw = sparse.csr_matrix(
+            (values, (rows, columns)), shape=shape, dtype=np.float32
+        )
+        norms = np.sqrt(np.asarray(raw.multiply(raw).sum(axis=1))).ravel()
+        scale = np.divide(
+            1.0, norms, out=np.zeros_like(norms), where=norms > 0
+        )
+        self.normalised = sparse.csr_matrix(sparse.diags(scale) @ raw)
+        self.popularity = np.asarray(self.seen.sum(axis=0)).ravel()
+
+    # rows of users in a location, or None for every user
+    def _location_mask(self, location):
+        if not location:
+            return None
+        return self.locations == location.strip().lower()
+
+    # media ids and scores for the best scoring unseen media
+    def _top(self, scores, seen, limit):
+        scores[seen] = -np.inf
+        count = min(limit, int(np.isfinite(scores).sum()))
+        if count == 0:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            (int(self.media_ids[column]), float(scores[column]))
+            for column in top
+        ]
+
+    # most interacted with media as a fallback for users without
+    # similar users, scored by their number of interactions
+    def _popular(self, mask, seen, limit):
+        if mask is None:
+            counts = self.popularity.astype(np.float64)
+        else:
+            counts = np.asarray(
+                self.seen[mask].sum(axis=0), dtype=np.float64
+            ).ravel()
+        counts[counts == 0] = -np.inf
+        return self._top(counts, seen, limit)
+
+    # predicted ratings of unseen media from the users most similar to
+    # the given user, returns the basis and (media id, score) pairs
+    def recommend(self, user_id, limit, location=None):
+        mask = self._location_mask(location)
+        row = self.user_index.get(user_id)
+        if row is None:
+            return POPULAR, self._popular(mask, [], limit)
+        seen = self.seen[row].indices
+        # cosine similarity to every user in one sparse product
+        similarity = (
+            self.normalised @ self.normalised[row].T
+        ).toarray().ravel()
+        similarity[row] = 0
+        if mask is not None:
+            similarity[~mask] = 0
+        count = min(NEIGHBOURS, int((similarity > 0).sum()))
+        if count == 0:
+            return POPULAR, self._popular(mask, seen, limit)
+        neighbours = np.argpartition(-similarity, count - 1)[:count]
+        weights = similarity[neighbours]
+        # weighted average of the neighbours' relative ratings for
+        # every media record at once
+        numerator = self.centred[neighbours].T @ weights
+        denominator = self.seen[neighbours].T @ weights
+        scores = np.full(len(self.media_ids), -np.inf)
+        rated = denominator > 0
+        scores[rated] = np.clip(
+            self.means[row] + numerator[rated] / denominator[rated], 0, 10
+        )
+        return SIMILAR_USERS, self._top(scores, seen, limit)
+
+
+# load a new model from the interaction and user tables
+def build_model():
+    user_ids, rows, media_ids, columns, values = load_preferences()
+    locations = dict(
+        db.session.execute(
+            db.select(User.id, User.location).filter(
+                User.location.isnot(None)
+            )
+        ).all()
+    )
+    locations = np.array(
+        [
+            (locations.get(int(user_id)) or "").lower()
+            for user_id in user_ids
+        ],
+        dtype=object
+    )
+    return PreferenceModel(
+        user_ids, rows, media_ids, columns, values, locations
+    )
+
+
+# per process model with the write generation it was built at
+_model = None
+_built_generation = -1
+_built_at = 0.0
+_generation = 0
+_rebuilding = False
+_lock = threading.Lock()
+# held while the first model is built so requests wait for one build
+_first_build_lock = threading.Lock()
+
+
+# mark the model stale after interactions have been committed
+def invalidate():
+    global _generation
+    with _lock:
+        _generation += 1
+
+
+# build the model and record the generation it reflects
+def _rebuild(app):
+    global _model, _built_generation, _built_at, _rebuilding
+    with _lock:
+        generation = _generation
+    try:
+        with app.app_context():
+            model = build_model()
+        with _lock:
+            _model = model
+            _built_generation = generation
+            _built_at = time.monotonic()
+    finally:
+        with _lock:
+            _rebuilding = False
+
+
+# return the current model, building the first one in the request
+# and later ones in a background thread while the old one serves
+def get_model(app):
+    global _rebuilding
+    if _model is None:
+        with _first_build_lock:
+            if _model is None:
+                _rebuild(app)
+        return _model
+    with _lock:
+        age = time.monotonic() - _built_at
+        stale = _built_generation != _generation or age > MAX_AGE
+        start = not _rebuilding and stale and age > MIN_REBUILD_INTERVAL
+        if start:
+            _rebuilding = True
+    if start:
+        threading.Thread(target=_rebuild, args=(app,), daemon=True).start()
+    return _model
@@ -0,0 +1,249 @@
+# in built import for environment variables
+import os
+# external imports for the sparse interaction matrix and SQL functions
+import numpy as np
+from scipy import sparse
+from sqlalchemy import case, func, or_
+from sqlalchemy.dialects.postgresql import insert
+# local imports for SQLAlchemy and models
+from init import db
+from models.interaction import Interaction, InteractionEnum
+from models.media_similarity import MediaSimilarity, SimilarityBuild
+from models.media_stats import MediaStats
+
+# number of neighbours stored for each media record
+NEIGHBOURS = int(os.getenv('SIMILARITY_NEIGHBOURS', 20))
+# score given to watched or watchlisted media that were not rated
+IMPLICIT_SCORE = float(os.getenv('SIMILARITY_IMPLICIT_SCORE', 5))
+# similarity measures supported by the build
+COSINE = "cosine"
+ADJUSTED_COSINE = "adjusted"
+# rows fetched per round trip while loading the matrix
+FETCH_SIZE = 50000
+# rows written per insert and ids per delete
+WRITE_SIZE = 5000
+
+
+# preference of a user for a media record, the rating where given
+# otherwise a fixed score for watched or watchlisted media
+def _preference():
+    return func.coalesce(
+        Interaction.rating,
+        case(
+            (
+                or_(
+                    Interaction.watched == InteractionEnum.yes,
+                    Interaction.watchlist == InteractionEnum.yes
+                ),
+                IMPLICIT_SCORE
+            )
+        )
+    )
+
+
+# load every preference as arrays of user ids, row indexes, media ids,
+# column indexes and values for building sparse matrices
+def load_preferences():
+    preference = _preference().label("preference")
+    result = db.session.execute(
+        db.select(Interaction.user_id, Interaction.media_id, preference)
+        .filter(preference.isnot(None))
+        .execution_options(yield_per=FETCH_SIZE)
+    )
+    users, media, values = [], [], []
+    for rows in result.partitions():
+        for user_id, media_id, value in rows:
+            users.append(user_id)
+            media.append(media_id)
+            values.append(value)
+    # map database ids onto consecutive row and column indexes
+    user_ids, rows = np.unique(np.asarray(users, dtype=np.int64),
+                               return_inverse=True)
+    media_ids, columns = np.unique(np.asarray(media, dtype=np.int64),
+                                   return_inverse=True)
+    values = np.asarray(values, dtype=np.float32)
+    return user_ids, rows, media_ids, columns, values
+
+
+# mean preference of each user row
+def user_means(rows, values, users):
+    totals = np.bincount(rows, weights=values, minlength=users)
+    counts = np.bincount(rows, minlength=users)
+    return np.divide(
+        totals, counts, out=np.zeros(users), where=counts > 0
+    ).astype(np.float32)
+
+
+# sparse users by media matrix of preferences
+def preference_matrix(user_ids, rows, media_ids, columns, values,
+                      method=COSINE):
+    if method == ADJUSTED_COSINE:
+        # subtract each user's mean so generous and harsh raters compare
+        values = values - user_means(rows, values, len(user_ids))[rows]
+    matrix = sparse.csr_matrix(
+        (values, (rows, columns)),
+        shape=(len(user_ids), len(media_ids)),
+        dtype=np.float32
+    )
+    matrix.eliminate_zeros()
+    return matrix
+
+
+# load every preference into a sparse users by media matrix,
+# returns the matrix and the media id of each column
+def load_matrix(method=COSINE):
+    user_ids, rows, media_ids, columns, values = load_preferences()
+    matrix = preference_matrix(
+        user_ids, rows, media_ids, columns, values, method
+    )
+    return matrix, media_ids
+
+
+# top neighbours of the given columns by cosine similarity,
+# yields the column and its (neighbour columns, scores) best first
+def neighbours(matrix, columns, k=NEIGHBOURS):
+    # scale every column to unit length so dot products are cosines
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalised = sparse.csc_matrix(matrix @ sparse.diags(scale))
+    transposed = normalised.T.tocsr()
+    # score blocks of columns at once, only media sharing a user
+    # with the column appear in the sparse result
+    block_size = 256
+    for start in range(0, len(columns), block_size):
+        block = columns[start:start + block_size]
+        scores = (transposed @ normalised[:, block]).tocsc()
+        for offset, column in enumerate(block):
+            begin, end = scores.indptr[offset], scores.indptr[offset + 1]
+            candidates = scores.indices[begin:end]
+            values = scores.data[begin:end]
+            keep = (candidates != column) & (values > 0)
+            candidates, values = candidates[keep], values[keep]
+            if len(values) > k:
+                top = np.argpartition(-values, k - 1)[:k]
+                candidates, values = candidates[top], values[top]
+            order = np.argsort(-values, kind="stable")
+            yield column, (candidates[order], values[order])
+
+
+# media whose totals changed and users whose interactions changed
+# since the given time
+def _changes(since, method):
+    changed_media = db.session.scalars(
+        db.select(MediaStats.media_id).filter(MediaStats.updated_at > since)
+    ).all()
+    changed_users = []
+    if method == ADJUSTED_COSINE:
+        changed_users = db.session.scalars(
+            db.select(Interaction.user_id).filter(
+                Interaction.updated_at > since
+            ).distinct()
+        ).all()
+    return changed_media, changed_users
+
+
+# media whose neighbours may have changed, a score between two media
+# only changes when one of them changed and they share a user, so
+# every column sharing a user with a changed column is recomputed,
+# with adjusted cosine a changed user's mean shifts all their media
+def _touched_media(matrix, user_ids, media_ids, changed_media,
+                   changed_users):
+    rated = matrix.copy()
+    rated.data[:] = 1
+    changed_columns = np.flatnonzero(np.isin(media_ids, changed_media))
+    changed_rows = np.flatnonzero(np.isin(user_ids, changed_users))
+    if len(changed_rows):
+        changed_columns = np.union1d(
+            changed_columns, rated[changed_rows].indices
+        )
+    sharing_rows = np.unique(rated.tocsc()[:, changed_columns].indices)
+    columns = np.unique(rated[sharing_rows].indices)
+    touched = set(media_ids[columns].tolist()) | set(changed_media)
+    # lists that contain a changed media hold a stale score for it,
+    # including media that lost every preference they shared
+    changed = sorted(set(media_ids[changed_columns].tolist())
+                     | set(changed_media))
+    for start in range(0, len(changed), WRITE_SIZE):
+        touched.update(
+            db.session.scalars(
+                db.select(MediaSimilarity.media_id).filter(
+                    MediaSimilarity.similar_id.in_(
+                        changed[start:start + WRITE_SIZE]
+                    )
+                ).distinct()
+            )
+        )
+    return touched
+
+
+# rebuild the stored neighbours, only for media touched since the
+# previous build unless full is set or the settings changed, returns
+# the media recomputed and the number of rows written
+def build(full=False, k=NEIGHBOURS, method=COSINE):
+    # the build is stamped with the start of the run so writes made
+    # while it runs are picked up again by the next refresh
+    started = db.session.scalar(db.select(func.now()))
+    previous = db.session.get(SimilarityBuild, 1)
+    full = (
+        full or previous is None
+        or previous.method != method or previous.neighbours != k
+    )
+    user_ids, rows, media_ids, columns, values = load_preferences()
+    matrix = preference_matrix(
+        user_ids, rows, media_ids, columns, values, method
+    )
+    if full:
+        db.session.execute(db.delete(MediaSimilarity))
+        columns = np.arange(len(media_ids))
+        recomputed = len(media_ids)
+    else:
+        changed_media, changed_users = _changes(previous.started_at, method)
+        targets = sorted(
+            _touched_media(
+                matrix, user_ids, media_ids, changed_media, changed_users
+            )
+        )
+        for start in range(0, len(targets), WRITE_SIZE):
+            db.session.execute(
+                db.delete(MediaSimilarity).filter(
+                    MediaSimilarity.media_id.in_(
+                        targets[start:start + WRITE_SIZE]
+                    )
+                )
+            )
+        # media without preferences left have no column and no neighbours
+        columns = np.flatnonzero(np.isin(media_ids, targets))
+        recomputed = len(targets)
+    written = 0
+    rows = []
+    for column, (similar, scores) in neighbours(matrix, columns, k):
+        media_id = int(media_ids[column])
+        rows.extend(
+            {
+                "media_id": media_id,
+                "rank": rank,
+                "similar_id": int(media_ids[similar_column]),
+                "score": float(score),
+                "computed_at": started
+            }
+            for rank, (similar_column, score) in enumerate(
+                zip(similar, scores), start=1
+            )
+        )
+        if len(rows) >= WRITE_SIZE:
+            db.session.execute(insert(MediaSimilarity), rows)
+            written += len(rows)
+            rows = []
+    if rows:
+        db.session.execute(insert(MediaSimilarity), rows)
+        written += len(rows)
+    # record the build even when no neighbours were written, so the
+    # next refresh starts from this run
+    settings = {"started_at": started, "method": method, "neighbours": k}
+    db.session.execute(
+        insert(SimilarityBuild).values(id=1, **settings)
+        .on_conflict_do_update(index_elements=["id"], set_=settings)
+    )
+    # readers keep the previous lists until the new ones are committed
+    db.session.commit()
+    return recomputed, written
@@ -0,0 +1,47 @@
+# in built import for thread locks and events
+import threading
+
+
+# holds the outcome of a call shared between waiting threads
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# registry of in-flight calls so concurrent callers with the same key
+# wait for one shared result instead of repeating the work
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    # run fn once per key, returns the result and whether it was shared
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            # first caller for the key becomes the leader
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        # other callers wait for the leader to finish
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as err:
+            # waiting callers receive the same exception
+            call.error = err
+            raise
+        finally:
+            # remove the key before waking waiters so later
+            # callers start a fresh call
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
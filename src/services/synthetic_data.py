@@ -0,0 +1,388 @@
+# in built imports for copy buffers, JSON ratings and timestamps
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from itertools import islice
+# external imports for vectorised random generation and upserts
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+# local imports for SQLAlchemy, models and password hashing
+from init import db
+from models.genre import Genre
+from models.person import Person
+from services import passwords
+
+# how strongly popularity is concentrated on the first ranks, media
+# follow a steeper curve than user activity
+MEDIA_SKEW = 1.1
+USER_SKEW = 0.7
+# share of comments starting a new thread, the rest are replies
+ROOT_SHARE = 0.1
+# chance a reply answers the comment just before it, longer chains
+# come from a higher value
+REPLY_CHAIN = 0.4
+# interactions and comments are spread over this many days
+HISTORY_DAYS = 60
+# rows written per COPY statement
+BATCH_SIZE = 50000
+
+GENRES = (
+    "Action", "Adventure", "Animation", "Biography", "Comedy", "Crime",
+    "Documentary", "Drama", "Family", "Fantasy", "History", "Horror",
+    "Music", "Mystery", "Romance", "Sci-Fi", "Sport", "Thriller", "War",
+    "Western"
+)
+LOCATIONS = (
+    "Melbourne", "Sydney", "Brisbane", "Perth", "Adelaide", "Hobart",
+    "Canberra", "Darwin", "Auckland", "London"
+)
+COUNTRIES = ("United States", "United Kingdom", "Australia", "Canada")
+
+
+# normalised Zipf weights over randomly ordered ranks, so the most
+# popular records are not simply the lowest ids
+def zipf_weights(count, skew, rng):
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    weights = weights[rng.permutation(count)]
+    return weights / weights.sum()
+
+
+# stream rows into a table with COPY, one statement per batch, the
+# csv module writes None as an empty unquoted field which COPY reads
+# as NULL
+def copy_rows(cursor, table, columns, rows, batch_size=BATCH_SIZE):
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    rows = iter(rows)
+    written = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return written
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows(batch)
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+        written += len(batch)
+
+
+# insert any missing names and return their ids in the given order
+def _name_ids(model, names, chunk_size=10000):
+    for start in range(0, len(names), chunk_size):
+        db.session.execute(
+            insert(model).values(
+                [{"name": name} for name in names[start:start + chunk_size]]
+            ).on_conflict_do_nothing(index_elements=[func.lower(model.name)])
+        )
+    db.session.commit()
+    ids = {}
+    for start in range(0, len(names), chunk_size):
+        keys = [name.lower() for name in names[start:start + chunk_size]]
+        ids.update(
+            db.session.execute(
+                db.select(func.lower(model.name), model.id).filter(
+                    func.lower(model.name).in_(keys)
+                )
+            ).all()
+        )
+    return np.array([ids[name.lower()] for name in names])
+
+
+# random timestamps within the history window, as numpy datetimes
+def _timestamps(rng, count, now):
+    offsets = rng.integers(0, HISTORY_DAYS * 86400, size=count)
+    return np.datetime64(now, "s") - offsets.astype("timedelta64[s]")
+
+
+# ids following the largest stored id of each table
+def _next_ids(cursor, table, count):
+    cursor.execute(f"SELECT coalesce(max(id), 0) FROM {table}")
+    first = cursor.fetchone()[0] + 1
+    return np.arange(first, first + count)
+
+
+def _user_rows(ids, password, rng):
+    locations = rng.choice(
+        len(LOCATIONS), size=len(ids), p=zipf_weights(
+            len(LOCATIONS), 1.0, rng
+        )
+    )
+    # a share of users leave their location empty
+    located = rng.random(len(ids)) < 0.8
+    for user_id, location, has_location in zip(
+            ids.tolist(), locations.tolist(), located.tolist()):
+        yield (
+            user_id,
+            f"synth_user_{user_id}",
+            f"synth_user_{user_id}@example.com",
+            password,
+            LOCATIONS[location] if has_location else None,
+            False,
+            0
+        )
+
+
+# media rows with their genre and credit links, generated in batches
+# so the random draws for millions of records stay small
+def _media_batches(ids, people_ids, genre_ids, quality, rng, batch_size):
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        size = len(batch)
+        series = rng.random(size) < 0.3
+        years = rng.integers(1950, 2025, size=size)
+        # up to three distinct genres per record
+        genre_counts = rng.integers(1, 4, size=size)
+        genre_picks = rng.random((size, len(GENRES))).argsort(axis=1)[:, :3]
+        # director, writer and three actors drawn from the people pool
+        credits = rng.integers(0, len(people_ids), size=(size, 5))
+        metascores = np.clip(
+            np.rint(quality[start:start + size] * 10), 1, 100
+        ).astype(int)
+        media, genre_links, people_links = [], [], []
+        for i, media_id in enumerate(batch.tolist()):
+            category = "series" if series[i] else "movie"
+            genres = [int(g) for g in genre_picks[i, :genre_counts[i]]]
+            director, writer, *actors = (
+                int(person) for person in credits[i]
+            )
+            actors = list(dict.fromkeys(actors))
+            score = float(quality[start + i])
+            media.append((
+                media_id,
+                f"Synthetic {category.title()} {media_id}",
+                str(years[i]),
+                category,
+                ", ".join(GENRES[genre] for genre in genres),
+                f"Synthetic Person {director}",
+                f"Synthetic Person {writer}",
+                ", ".join(f"Synthetic Person {actor}" for actor in actors),
+                f"Generated {category} number {media_id}"
+                " for load testing.",
+                COUNTRIES[media_id % len(COUNTRIES)],
+                json.dumps([
+                    {
+                        "Source": "Internet Movie Database",
+                        "Value": f"{score:.1f}/10"
+                    }
+                ]),
+                None if series[i] else str(metascores[i]),
+                None if series[i] else f"${media_id * 1000:,}",
+                0
+            ))
+            genre_links.extend(
+                (media_id, int(genre_ids[genre])) for genre in genres
+            )
+            people_links.append(
+                (media_id, int(people_ids[director]), "director")
+            )
+            people_links.append(
+                (media_id, int(people_ids[writer]), "writer")
+            )
+            people_links.extend(
+                (media_id, int(people_ids[actor]), "actor")
+                for actor in actors
+            )
+        yield media, genre_links, people_links
+
+
+# unique (user, media) pairs drawn from the skewed distributions,
+# returns fewer pairs only when the distributions cannot supply them
+def _interaction_pairs(user_ids, media_ids, count, rng):
+    count = min(count, len(user_ids) * len(media_ids))
+    user_weights = zipf_weights(len(user_ids), USER_SKEW, rng)
+    media_weights = zipf_weights(len(media_ids), MEDIA_SKEW, rng)
+    keys = np.empty(0, dtype=np.int64)
+    for attempt in range(20):
+        missing = count - len(keys)
+        if missing <= 0:
+            break
+        # draw more extra pairs each round as duplicates become likelier
+        draw = int(missing * 1.2 * 2 ** attempt) + 16
+        users = rng.choice(len(user_ids), size=draw, p=user_weights)
+        media = rng.choice(len(media_ids), size=draw, p=media_weights)
+        keys = np.unique(
+            np.concatenate([keys, users.astype(np.int64) * len(media_ids)
+                            + media])
+        )
+    keys = rng.permutation(keys)[:count]
+    return keys // len(media_ids), keys % len(media_ids)
+
+
+# rows for interactions between users and media given by their
+# position in media_ids
+def _interaction_rows(users, media_ids, media, quality, now, rng):
+    count = len(users)
+    watched = rng.random(count) < 0.6
+    # watched media are rated more often, ratings follow each
+    # record's quality so similar users agree with each other
+    rated = rng.random(count) < np.where(watched, 0.7, 0.05)
+    ratings = np.clip(
+        np.rint(rng.normal(quality[media], 1.5)), 0, 10
+    ).astype(int).astype(object)
+    ratings[~rated] = None
+    watchlist = rng.random(count) < np.where(watched, 0.1, 0.5)
+    created = np.char.add(
+        _timestamps(rng, count, now).astype(str), "+00"
+    ).tolist()
+    return zip(
+        np.asarray(users).tolist(),
+        media_ids[media].tolist(),
+        np.where(watched, "yes", "no").tolist(),
+        ratings.tolist(),
+        np.where(watchlist, "yes", "no").tolist(),
+        created,
+        created
+    )
+
+
+# parent index of every comment, -1 for thread roots, and the root
+# each comment belongs to
+def comment_threads(count, rng):
+    offsets = np.where(
+        rng.random(count) < REPLY_CHAIN,
+        1,
+        rng.geometric(0.2, size=count)
+    )
+    parents = np.arange(count) - offsets
+    is_root = (rng.random(count) < ROOT_SHARE) | (parents < 0)
+    parents[is_root] = -1
+    # follow parents until every comment points at its root, halving
+    # the remaining distance each pass
+    roots = np.where(is_root, np.arange(count), parents)
+    while True:
+        jumped = roots[roots]
+        if np.array_equal(jumped, roots):
+            break
+        roots = jumped
+    return parents, roots
+
+
+def _comment_rows(ids, user_ids, media_ids, now, rng):
+    count = len(ids)
+    parents, roots = comment_threads(count, rng)
+    # threads start on popular media, replies stay on their root's media
+    root_media = rng.choice(
+        len(media_ids), size=count,
+        p=zipf_weights(len(media_ids), MEDIA_SKEW, rng)
+    )
+    media = media_ids[root_media[roots]]
+    users = user_ids[
+        rng.choice(
+            len(user_ids), size=count,
+            p=zipf_weights(len(user_ids), USER_SKEW, rng)
+        )
+    ]
+    parent_ids = ids[parents].astype(object)
+    parent_ids[parents < 0] = None
+    # sorted so replies are always created after their parents
+    created = np.sort(_timestamps(rng, count, now)).astype(str).tolist()
+    ids = ids.tolist()
+    return zip(
+        ids,
+        (f"Synthetic comment {comment_id}" for comment_id in ids),
+        created,
+        parent_ids.tolist(),
+        users.tolist(),
+        media.tolist(),
+        [0] * count
+    )
+
+
+# point a table's id sequence past the ids written with COPY
+def _reset_sequence(cursor, table):
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'),"
+        f" (SELECT max(id) FROM {table}))"
+    )
+
+
+# generate and load synthetic users, media, interactions and comments,
+# returns the number of rows written to each table
+def seed(users, media, interactions, comments, password="password",
+         random_seed=None, batch_size=BATCH_SIZE):
+    rng = np.random.default_rng(random_seed)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    # one hash shared by every synthetic user
+    password_hash = passwords.hash_password(password)
+    genre_ids = _name_ids(Genre, list(GENRES))
+    people_ids = _name_ids(
+        Person,
+        [f"Synthetic Person {n}" for n in range(max(50, media // 5))]
+    )
+    # average rating of each record, shared by its ratings and metascore
+    quality = np.clip(rng.normal(6.5, 1.5, size=media), 1, 10)
+    counts = dict.fromkeys(
+        ("users", "media", "media_genres", "media_people", "interaction",
+         "comments"), 0
+    )
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # explicit ids are read from the current maximum, so block
+        # other writers until the load commits
+        cursor.execute(
+            "LOCK TABLE users, media, interaction, comments"
+            " IN SHARE ROW EXCLUSIVE MODE"
+        )
+        user_ids = _next_ids(cursor, "users", users)
+        counts["users"] = copy_rows(
+            cursor, "users",
+            ("id", "username", "email", "password", "location",
+             "is_admin", "token_version"),
+            _user_rows(user_ids, password_hash, rng), batch_size
+        )
+        media_ids = _next_ids(cursor, "media", media)
+        for media_rows, genre_links, people_links in _media_batches(
+                media_ids, people_ids, genre_ids, quality, rng, batch_size):
+            counts["media"] += copy_rows(
+                cursor, "media",
+                ("id", "title", "year", "category", "genre", "director",
+                 "writer", "actors", "plot", "country", "ratings",
+                 "metascore", "box_office", "comment_count"),
+                media_rows, batch_size
+            )
+            counts["media_genres"] += copy_rows(
+                cursor, "media_genres", ("media_id", "genre_id"),
+                genre_links, batch_size
+            )
+            counts["media_people"] += copy_rows(
+                cursor, "media_people", ("media_id", "person_id", "role"),
+                people_links, batch_size
+            )
+        if users and media:
+            pair_users, pair_media = _interaction_pairs(
+                user_ids, media_ids, interactions, rng
+            )
+            counts["interaction"] = copy_rows(
+                cursor, "interaction",
+                ("user_id", "media_id", "watched", "rating", "watchlist",
+                 "created_at", "updated_at"),
+                _interaction_rows(
+                    user_ids[pair_users], media_ids, pair_media,
+                    quality, now, rng
+                ),
+                batch_size
+            )
+            comment_ids = _next_ids(cursor, "comments", comments)
+            counts["comments"] = copy_rows(
+                cursor, "comments",
+                ("id", "content", "created", "parent_id", "user_id",
+                 "media_id", "reply_count"),
+                _comment_rows(comment_ids, user_ids, media_ids, now, rng),
+                batch_size
+            )
+        for table in ("users", "media", "comments"):
+            _reset_sequence(cursor, table)
+        # refresh planner statistics for the new row counts
+        cursor.execute(
+            "ANALYZE users, media, media_genres, media_people,"
+            " interaction, comments"
+        )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+    return counts
@@ -0,0 +1,55 @@
+# in built import for environment variables
+import os
+# local imports for SQLAlchemy, the user model and caching
+from init import db
+from models.user import User
+from services.ttl_cache import TTLCache
+
+# cached version for users that no longer exist
+DELETED = -1
+# current token version of recently seen users, so a demotion or
+# deletion reaches other workers once their entry expires
+versions = TTLCache(
+    maxsize=int(os.getenv('TOKEN_VERSION_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('TOKEN_VERSION_CACHE_TTL', 60))
+)
+
+
+# claims added to access tokens for the checks in the controllers
+def claims_for(user):
+    return {"is_admin": bool(user.is_admin), "ver": user.token_version}
+
+
+# current token version of a user, read from the database at most
+# once per user each time the cached entry expires
+def current(user_id):
+    version = versions.get(user_id)
+    if version is None:
+        version = db.session.scalar(
+            db.select(User.token_version).filter_by(id=user_id)
+        )
+        if version is None:
+            version = DELETED
+        versions.set(user_id, version)
+    return version
+
+
+# token blocklist callback, tokens issued before the user's version
+# was bumped or for a deleted user are rejected
+def is_revoked(jwt_header, jwt_payload):
+    return current(int(jwt_payload["sub"])) != jwt_payload.get("ver", 0)
+
+
+# invalidate every token issued to a user, takes effect once the
+# transaction is committed and forget is called
+def revoke(user_id):
+    db.session.execute(
+        db.update(User).where(User.id == user_id).values(
+            token_version=User.token_version + 1
+        )
+    )
+
+
+# drop a cached version after a committed change to the user
+def forget(user_id):
+    versions.delete(user_id)
@@ -0,0 +1,63 @@
+# in built imports for ordered storage, clocks and thread locks
+import threading
+import time
+from collections import OrderedDict
+
+
+# thread safe cache with a time to live per entry and
+# least recently used eviction once the size limit is reached
+class TTLCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    # return the cached value or default, counting hits and misses
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    # mark the entry as most recently used
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                # drop expired entries as they are found
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    # store a value and evict the least recently used entries
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # remove a single entry if present
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    # remove every entry and reset the counters
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    # summary of cache usage for monitoring
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,49 @@
+# in built import for replacing the configured limits
+from unittest import mock
+# local import for the login limits
+from services import login_throttle
+
+
+def make_throttle():
+    return login_throttle.LoginThrottle(login_throttle.MemoryBackend())
+
+
+def fail(throttle, identity, ip, times):
+    for _ in range(times):
+        assert throttle.attempt(identity, ip) is None
+        throttle.failed(identity, ip)
+
+
+def test_failures_from_one_ip_do_not_lock_other_ips():
+    throttle = make_throttle()
+    fail(throttle, "bob", "10.0.0.1", login_throttle.IDENTITY_LIMIT)
+    assert throttle.attempt("bob", "10.0.0.1") is not None
+    assert throttle.attempt("bob", "10.0.0.2") is None
+
+
+def test_failures_from_many_ips_reach_the_account_limit():
+    throttle = make_throttle()
+    with mock.patch.object(login_throttle, "ACCOUNT_LIMIT", 12):
+        # each address stays under its own limit of 5
+        for host in range(4):
+            fail(throttle, "bob", f"10.0.0.{host}", 3)
+        # a new address is refused once the account has 12 failures
+        assert throttle.attempt("bob", "10.0.1.1") is not None
+        # other accounts are unaffected
+        assert throttle.attempt("alice", "10.0.1.1") is None
+
+
+def test_success_keeps_the_account_count():
+    throttle = make_throttle()
+    with mock.patch.object(login_throttle, "ACCOUNT_LIMIT", 6):
+        fail(throttle, "bob", "10.0.0.1", 4)
+        throttle.succeeded("bob", "10.0.0.2")
+        fail(throttle, "bob", "10.0.0.2", 2)
+        assert throttle.attempt("bob", "10.0.0.3") is not None
+
+
+def test_identity_is_matched_exactly():
+    throttle = make_throttle()
+    fail(throttle, "Bob", "10.0.0.1", login_throttle.IDENTITY_LIMIT)
+    assert throttle.attempt("Bob", "10.0.0.1") is not None
+    assert throttle.attempt("bob", "10.0.0.1") is None
@@ -0,0 +1,97 @@
+# in built imports for replacing database and OMDb calls
+from types import SimpleNamespace
+from unittest import mock
+# local imports for SQLAlchemy and the OMDb loader
+from init import db
+from services import media_import, token_versions
+
+OMDB_RECORD = {
+    "Title": "Iron Man",
+    "Year": "2008",
+    "Type": "movie",
+    "Genre": "Action",
+    "Response": "True"
+}
+
+
+def test_insert_media_reports_new_rows(app):
+    with mock.patch.object(db.session, "scalar", return_value=7), \
+            mock.patch.object(media_import, "link_credits") as link, \
+            mock.patch.object(db.session, "commit"):
+        assert media_import.insert_media(
+            {"title": "Iron Man", "category": "movie"}
+        ) == (7, True)
+    link.assert_called_once()
+
+
+def test_insert_media_conflict_returns_existing_row(app):
+    # the insert hits ON CONFLICT and returns nothing, then the
+    # record stored by another worker is selected
+    with mock.patch.object(
+                db.session, "scalar", side_effect=[None, 3]
+            ), \
+            mock.patch.object(media_import, "link_credits") as link, \
+            mock.patch.object(db.session, "commit"):
+        assert media_import.insert_media(
+            {"title": "Iron Man", "category": "movie"}
+        ) == (3, False)
+    link.assert_not_called()
+
+
+def test_fetch_media_conflict_is_not_created(app):
+    media_import.title_cache.clear()
+    with mock.patch.object(
+                media_import.omdb_client, "fetch", return_value=OMDB_RECORD
+            ), \
+            mock.patch.object(
+                media_import, "insert_media", return_value=(3, False)
+            ):
+        outcome, media_id, shared = media_import.fetch_media(
+            "iron man ", "movie"
+        )
+    assert (outcome, media_id, shared) == (media_import.EXISTING, 3, False)
+
+
+def test_fetch_media_remembers_requested_title(app):
+    media_import.title_cache.clear()
+    with mock.patch.object(
+                media_import.omdb_client, "fetch", return_value=OMDB_RECORD
+            ) as fetch, \
+            mock.patch.object(
+                media_import, "insert_media", return_value=(3, True)
+            ), \
+            mock.patch.object(
+                db.session, "get", return_value=SimpleNamespace(id=3)
+            ):
+        first = media_import.fetch_media("Iron Man (2008)", "movie")
+        second = media_import.fetch_media("iron man (2008)", "movie")
+    assert first == (media_import.CREATED, 3, False)
+    # the second request is answered without another OMDb call
+    assert second == (media_import.EXISTING, 3, True)
+    fetch.assert_called_once()
+
+
+def test_movie_route_returns_200_on_conflict(app):
+    from flask_jwt_extended import create_access_token
+    token = create_access_token(identity="1")
+    movie = SimpleNamespace(
+        id=3, title="Iron Man", year="2008", category=None
+    )
+    # the token's version matches the user's stored version
+    with mock.patch.object(token_versions, "current", return_value=0), \
+            mock.patch("controllers.media_controller.Media") as media, \
+            mock.patch.object(
+                media_import, "fetch_media",
+                return_value=(media_import.EXISTING, 3, False)
+            ), \
+            mock.patch.object(db.session, "get", return_value=movie), \
+            mock.patch(
+                "controllers.media_controller.media_schema"
+            ) as schema:
+        media.query.filter.return_value.first.return_value = None
+        schema.dump.return_value = {"id": 3}
+        response = app.test_client().get(
+            "/media/movie?title=iron man",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+    assert response.status_code == 200
@@ -0,0 +1,45 @@
+# in built imports for pools, futures and replacing the pool
+from concurrent.futures import Future, ProcessPoolExecutor
+from unittest import mock
+# external import for expected exceptions
+import pytest
+# local import for the password pool
+from services import passwords
+
+
+def finished(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def shut_down_pool():
+    pool = ProcessPoolExecutor(max_workers=1)
+    pool.shutdown()
+    return pool
+
+
+def free_slots():
+    return passwords._pending._value
+
+
+def test_submit_to_a_shut_down_pool_retries_with_a_new_pool():
+    replacement = mock.Mock()
+    replacement.submit.return_value = finished("hashed")
+    slots = free_slots()
+    with mock.patch.object(
+        passwords, "_get_pool", side_effect=[shut_down_pool(), replacement]
+    ):
+        assert passwords._run(passwords._hash, "secret", 4) == "hashed"
+    assert free_slots() == slots
+
+
+def test_slot_is_released_when_no_pool_accepts_the_job():
+    slots = free_slots()
+    with mock.patch.object(
+        passwords, "_get_pool",
+        side_effect=[shut_down_pool(), shut_down_pool()]
+    ):
+        with pytest.raises(passwords.PasswordPoolBusy):
+            passwords._run(passwords._hash, "secret", 4)
+    assert free_slots() == slots